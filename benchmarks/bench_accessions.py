@@ -0,0 +1,101 @@
+"""Micro-benchmarks the vectorized accession normalization on a million identifiers.
+
+A mix of FASTA-style UniProt identifiers, isoforms, bare UniProt, RefSeq and Ensembl
+accessions (with and without version suffixes) is normalized by
+
+- get_clean_acc in a Python loop, the previous per-accession helper (which only
+  understood 'db|ACC|NAME'), for reference,
+- the same rules as normalize_accessions applied with Python's re in a loop,
+- normalize_accessions over one Arrow array.
+
+map_accessions, which also splits protein groups, deduplicates and drops decoys, is timed
+on protein group entries holding the same accessions.
+
+    python benchmarks/bench_accessions.py --accessions 1000000
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+import click
+import pyarrow as pa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import triqler_runner  # noqa: E402
+
+
+def synthetic_accessions(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+    def uniprot() -> str:
+        return f"{rng.choice('OPQ')}{rng.randint(0, 9)}{rng.choice(letters)}{rng.randint(10, 99)}{rng.randint(0, 9)}"
+
+    makers = [
+        lambda: f"sp|{uniprot()}|PROT{rng.randint(1, 99999)}_HUMAN",
+        lambda: f"tr|{uniprot()}-{rng.randint(2, 9)}|PROT{rng.randint(1, 99999)}_MOUSE",
+        lambda: uniprot(),
+        lambda: f"{uniprot()}-{rng.randint(2, 9)}",
+        lambda: f"{rng.choice(['NP', 'XP'])}_{rng.randint(1, 999999):06d}.{rng.randint(1, 5)}",
+        lambda: f"{rng.choice(['NP', 'XP'])}_{rng.randint(1, 999999):06d}",
+        lambda: f"ENS{rng.choice(['P', 'G', 'MUSP'])}{rng.randint(0, 10 ** 11 - 1):011d}.{rng.randint(1, 9)}",
+        lambda: f" ENSP{rng.randint(0, 10 ** 11 - 1):011d} ",
+    ]
+    return [rng.choice(makers)() for _ in range(count)]
+
+
+def previous_get_clean_acc(acc: str) -> str:
+    """get_clean_acc before the vectorized normalization."""
+    if "|" in acc:
+        parts = acc.split("|")
+        if len(parts) > 1:
+            return parts[1]
+    return acc
+
+
+def normalize_with_re(accessions: list) -> list:
+    """The rules of normalize_accessions, one accession at a time with Python's re."""
+    isoform = re.compile(triqler_runner.UNIPROT_ISOFORM_PATTERN)
+    version = re.compile(triqler_runner.ACCESSION_VERSION_PATTERN)
+    clean = []
+    for acc in accessions:
+        acc = acc.strip()
+        if "|" in acc:
+            acc = acc.split("|", 2)[1]
+        acc = isoform.sub(r"\1", acc)
+        clean.append(version.sub(r"\1", acc))
+    return clean
+
+
+def timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"  {label:<52} {time.perf_counter() - start:7.2f} s")
+    return result
+
+
+@click.command()
+@click.option("--accessions", type=int, default=1000000, help="Number of synthetic accessions")
+def main(accessions: int) -> None:
+    raw = synthetic_accessions(accessions)
+    print(f"{len(raw)} accessions, {len(set(raw))} distinct")
+
+    print("Normalization")
+    timed("get_clean_acc loop (previous, 'db|ACC|NAME' only)", lambda: [previous_get_clean_acc(a) for a in raw])
+    expected = timed("same rules with re in a Python loop", lambda: normalize_with_re(raw))
+    array = pa.array(raw)
+    normalized = timed("normalize_accessions", lambda: triqler_runner.normalize_accessions(array))
+    print("Results identical" if normalized.to_pylist() == expected else "Results differ")
+
+    groups = [";".join(raw[i:i + 3]) for i in range(0, len(raw), 3)]
+    groups = pa.array([f"decoy_{g}" if i % 20 == 0 else g for i, g in enumerate(groups)])
+    print(f"map_accessions over {len(groups)} protein groups")
+    timed("map_accessions", lambda: triqler_runner.map_accessions(groups, "decoy_"))
+
+
+if __name__ == "__main__":
+    main()
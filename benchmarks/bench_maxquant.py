@@ -0,0 +1,133 @@
+"""Benchmarks the pyarrow MaxQuant evidence.txt conversion against the previous path.
+
+A synthetic evidence.txt with the usual ~60 MaxQuant columns is generated, then converted by
+
+- triqler.convert.maxquant in a subprocess, as triqler_runner did before (skipped when
+  Triqler is not importable),
+- convert_maxquant_to_triqler, the multithreaded typed reader with column projection.
+
+Parsing alone is also compared: pandas.read_csv inferring the dtypes of every column
+against read_maxquant_evidence.
+
+    python benchmarks/bench_maxquant.py --rows 1000000
+"""
+
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import triqler_runner  # noqa: E402
+
+RUNS = 12
+FILLER_COLUMNS = 30
+
+
+def write_evidence(path: str, rows: int, seed: int = 0, chunk_rows: int = 200000) -> None:
+    """Writes a synthetic evidence.txt with realistic MaxQuant columns plus numeric filler columns."""
+    rng = np.random.default_rng(seed)
+    peptides = np.array([
+        "".join(rng.choice(list("ACDEFGHIKLMNPQRSTVWY"), rng.integers(7, 25))) for _ in range(20000)
+    ])
+    proteins = np.array([f"P{i:05d}" for i in range(4000)])
+    for start in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - start)
+        pep_idx = rng.integers(0, len(peptides), n)
+        prot = proteins[pep_idx % len(proteins)]
+        second = proteins[(pep_idx * 7) % len(proteins)]
+        reverse = rng.random(n) < 0.05
+        protein_group = np.where(rng.random(n) < 0.3, np.char.add(np.char.add(prot, ";"), second), prot)
+        protein_group = np.where(reverse, np.char.add("REV__", prot), protein_group)
+        sequence = peptides[pep_idx]
+        frame = pd.DataFrame({
+            "Sequence": sequence,
+            "Length": np.char.str_len(sequence),
+            "Modifications": "Unmodified",
+            "Modified sequence": np.char.add(np.char.add("_", sequence), "_"),
+            "Oxidation (M) Probabilities": "",
+            "Oxidation (M) Score Diffs": "",
+            "Acetyl (Protein N-term)": 0,
+            "Oxidation (M)": 0,
+            "Missed cleavages": rng.integers(0, 3, n),
+            "Proteins": protein_group,
+            "Leading proteins": protein_group,
+            "Leading razor protein": np.where(reverse, np.char.add("REV__", prot), prot),
+            "Gene names": np.char.add("GENE", np.char.lstrip(prot, "P")),
+            "Protein names": "Synthetic protein",
+            "Type": rng.choice(["MULTI-MSMS", "MULTI-MATCH", "MSMS"], n),
+            "Raw file": np.char.add("run", (rng.integers(0, RUNS, n)).astype(str)),
+            "Experiment": "",
+            "MS/MS m/z": rng.uniform(300, 1500, n),
+            "Charge": rng.integers(1, 5, n),
+            "m/z": rng.uniform(300, 1500, n),
+            "Mass": rng.uniform(600, 4000, n),
+            "Resolution": rng.uniform(30000, 60000, n),
+            "Uncalibrated - Calibrated m/z [ppm]": rng.normal(0, 1, n),
+            "Mass error [ppm]": rng.normal(0, 2, n),
+            "Retention time": rng.uniform(0, 120, n),
+            "Retention length": rng.uniform(0.1, 1, n),
+            "Calibrated retention time": rng.uniform(0, 120, n),
+            "PEP": rng.uniform(0, 0.05, n),
+            "MS/MS count": rng.integers(0, 4, n),
+            "Score": rng.uniform(1, 250, n),
+            "Delta score": rng.uniform(0, 200, n),
+            "Intensity": np.where(rng.random(n) < 0.1, np.nan, rng.lognormal(16, 2, n)),
+            "Reverse": np.where(reverse, "+", ""),
+            "Potential contaminant": "",
+            "id": np.arange(start, start + n),
+            **{f"Filler {i}": rng.uniform(0, 1, n) for i in range(FILLER_COLUMNS)},
+        })
+        frame.to_csv(path, sep="\t", index=False, mode="a" if start else "w", header=start == 0)
+
+
+def timed(label: str, func) -> float:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<58} {elapsed:8.2f} s")
+    return elapsed
+
+
+@click.command()
+@click.option("--rows", type=int, default=500000, help="Rows of the synthetic evidence.txt")
+@click.option("--work_dir", default=None, help="Directory for the generated files (a temporary one by default)")
+def main(rows: int, work_dir) -> None:
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        evidence_file = os.path.join(tmp, "evidence.txt")
+        file_list_file = os.path.join(tmp, "file_list.tsv")
+        write_evidence(evidence_file, rows)
+        with open(file_list_file, "w") as f:
+            # Triqler's converter needs the sample and fraction columns
+            for i in range(RUNS):
+                f.write(f"run{i}\t{'A' if i < RUNS // 2 else 'B'}\tsample{i}\t1\n")
+        size_mb = os.path.getsize(evidence_file) / 1024 ** 2
+        print(f"evidence.txt: {rows} rows, {size_mb:.0f} MB")
+
+        print("Conversion")
+        if importlib.util.find_spec("triqler") is not None:
+            timed("triqler.convert.maxquant (previous path)", lambda: subprocess.run(
+                [sys.executable, "-m", "triqler.convert.maxquant", evidence_file,
+                 "--file_list_file", file_list_file, "--out_file", os.path.join(tmp, "previous.tsv")],
+                check=True, stdout=subprocess.DEVNULL,
+            ))
+        else:
+            print(f"  {'triqler.convert.maxquant (previous path)':<58} skipped, triqler is not importable")
+        timed("convert_maxquant_to_triqler", lambda: triqler_runner.convert_maxquant_to_triqler(
+            evidence_file, file_list_file, os.path.join(tmp, "converted.tsv"), "REV__",
+        ))
+
+        print("Parsing only")
+        timed("pandas.read_csv, every column with inferred dtypes", lambda: pd.read_csv(evidence_file, sep="\t"))
+        timed("read_maxquant_evidence", lambda: triqler_runner.read_maxquant_evidence(evidence_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Benchmarks the single-pass protein file post-processing against the previous two rewrites.
+
+Synthetic Triqler results (proteins.tsv plus per-comparison files, with peptides spilling
+into extra columns) are post-processed twice, with gene names from a stub lookup:
+
+- the previous cleanup_protein_files followed by add_gene_names, which read every file
+  three times and rewrote it twice,
+- postprocess_protein_files.
+
+Wall time and the bytes this process read and wrote (/proc/self/io, Linux only) are
+reported, and the two outputs are checked to be identical.
+
+    python benchmarks/bench_postprocess.py --proteins 100000 --comparisons 3
+"""
+
+import csv
+import filecmp
+import glob
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import triqler_runner  # noqa: E402
+
+RUNS = 24
+
+
+def write_protein_file(path: str, proteins: int, rng: random.Random) -> None:
+    """Writes a Triqler protein results file in which a fifth of the rows have ragged peptide columns."""
+    header = ["q_value", "posterior_error_prob", "protein", "num_peptides", "protein_id_posterior_error_prob",
+              "log2_fold_change", "diff_exp_prob_1.0"] + [f"run{i}:A" for i in range(RUNS)] + ["peptides"]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("\t".join(header) + "\n")
+        for i in range(proteins):
+            protein = f"sp|P{i:05d}|PROT{i}_HUMAN" if i % 10 else f"sp|P{i:05d}|PROT{i}_HUMAN;Q{i:05d}"
+            if i % 25 == 0:
+                protein = f"decoy_{protein}"
+            peptides = [f"PEPTIDE{i}K{j}" for j in range(rng.randint(1, 12))]
+            fields = [f"{rng.random():.6g}", f"{rng.random():.6g}", protein, str(len(peptides)), f"{rng.random():.6g}",
+                      f"{rng.gauss(0, 1):.4f}", f"{rng.random():.6g}"]
+            fields += [f"{rng.lognormvariate(0, 1):.4f}" for _ in range(RUNS)]
+            if rng.random() < 0.2:
+                # Peptides spilling into extra columns
+                fields += peptides
+            else:
+                fields.append(";".join(peptides))
+            f.write("\t".join(fields) + "\n")
+
+
+def previous_cleanup_protein_files(output_dir: str) -> None:
+    """cleanup_protein_files before the single-pass rewrite."""
+    for file_path in glob.glob(os.path.join(output_dir, "proteins*.tsv")):
+        temp_file = file_path + ".clean"
+        with open(file_path, "r", encoding="utf-8") as f_in, \
+             open(temp_file, "w", encoding="utf-8", newline="") as f_out:
+            reader = csv.DictReader(f_in, delimiter="\t")
+            writer = csv.DictWriter(f_out, fieldnames=reader.fieldnames, delimiter="\t", extrasaction="ignore")
+            writer.writeheader()
+            for row in reader:
+                extras = row.get(None, [])
+                if extras and "peptides" in row:
+                    clean_extras = [x.strip() for x in extras if x and x.strip()]
+                    if clean_extras:
+                        row["peptides"] = row["peptides"] + ";" + ";".join(clean_extras)
+                writer.writerow(row)
+        os.replace(temp_file, file_path)
+
+
+def previous_add_gene_names(output_dir: str, decoy_pattern: str, gene_lookup) -> None:
+    """add_gene_names before the single-pass rewrite, with gene_lookup in place of UniProt."""
+    protein_files = glob.glob(os.path.join(output_dir, "proteins*.tsv"))
+
+    def get_clean_acc(acc: str) -> str:
+        if "|" in acc:
+            parts = acc.split("|")
+            if len(parts) > 1:
+                return parts[1]
+        return acc
+
+    raw_to_clean = {}
+    for file_path in protein_files:
+        with open(file_path, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f, delimiter="\t"):
+                for raw_acc in row["protein"].split(";"):
+                    if not raw_acc.startswith(decoy_pattern):
+                        raw_to_clean[raw_acc] = get_clean_acc(raw_acc)
+    mapping = gene_lookup(set(raw_to_clean.values()))
+
+    for file_path in protein_files:
+        temp_file = file_path + ".tmp"
+        with open(file_path, "r", encoding="utf-8") as f_in, \
+             open(temp_file, "w", encoding="utf-8", newline="") as f_out:
+            reader = csv.DictReader(f_in, delimiter="\t")
+            fieldnames = list(reader.fieldnames)
+            prot_idx = fieldnames.index("protein")
+            writer = csv.DictWriter(
+                f_out, fieldnames=fieldnames[:prot_idx + 1] + ["gene_name"] + fieldnames[prot_idx + 1:], delimiter="\t",
+            )
+            writer.writeheader()
+            for row in reader:
+                genes = []
+                for r_acc in row["protein"].split(";"):
+                    g = mapping.get(raw_to_clean.get(r_acc, r_acc), "")
+                    if g and g not in genes:
+                        genes.append(g)
+                row["gene_name"] = ";".join(genes)
+                writer.writerow(row)
+        os.replace(temp_file, file_path)
+
+
+def stub_gene_lookup(clean_accessions):
+    return {acc: f"GENE{acc[1:]}" for acc in clean_accessions if acc.startswith("P")}
+
+
+def io_counters():
+    """Returns (bytes read, bytes written) by this process so far, or None off Linux."""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return None
+    return int(counters["rchar"]), int(counters["wchar"])
+
+
+def measure(label: str, func) -> None:
+    before = io_counters()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    after = io_counters()
+    io = "I/O n/a"
+    if before and after:
+        io = f"read {(after[0] - before[0]) / 1024 ** 2:8.0f} MB, written {(after[1] - before[1]) / 1024 ** 2:6.0f} MB"
+    print(f"  {label:<44} {elapsed:7.2f} s   {io}")
+
+
+@click.command()
+@click.option("--proteins", type=int, default=50000, help="Proteins per results file")
+@click.option("--comparisons", type=int, default=3, help="Per-comparison results files besides proteins.tsv")
+@click.option("--work_dir", default=None, help="Directory for the generated files (a temporary one by default)")
+def main(proteins: int, comparisons: int, work_dir) -> None:
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        source_dir = os.path.join(tmp, "source")
+        os.makedirs(source_dir)
+        rng = random.Random(0)
+        write_protein_file(os.path.join(source_dir, "proteins.tsv"), proteins, rng)
+        for i in range(comparisons):
+            write_protein_file(os.path.join(source_dir, f"proteins.{i + 1}vs{i + 2}.tsv"), proteins, rng)
+        size_mb = sum(os.path.getsize(p) for p in glob.glob(os.path.join(source_dir, "*"))) / 1024 ** 2
+        print(f"{comparisons + 1} results files, {proteins} proteins each, {size_mb:.0f} MB")
+
+        previous_dir = shutil.copytree(source_dir, os.path.join(tmp, "previous"))
+        fused_dir = shutil.copytree(source_dir, os.path.join(tmp, "fused"))
+
+        def previous() -> None:
+            previous_cleanup_protein_files(previous_dir)
+            previous_add_gene_names(previous_dir, "decoy_", stub_gene_lookup)
+
+        measure("cleanup_protein_files + add_gene_names", previous)
+        measure("postprocess_protein_files", lambda: triqler_runner.postprocess_protein_files(
+            fused_dir, "decoy_", 1, stub_gene_lookup,
+        ))
+
+        names = sorted(os.listdir(source_dir))
+        _, mismatch, errors = filecmp.cmpfiles(previous_dir, fused_dir, names, shallow=False)
+        print("Outputs identical" if not mismatch and not errors else f"Outputs differ: {mismatch + errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""The conversion cache shares entries with the runs that use them through hardlinks."""
+
+import os
+
+import triqler_runner
+
+
+def store(cache_dir, tmp_path, key, size, max_bytes=10 ** 6):
+    output_file = str(tmp_path / f"{key}_out.tsv")
+    with open(output_file, "w") as f:
+        f.write("x" * size)
+    triqler_runner.store_cached_conversion(cache_dir, key, output_file, max_bytes)
+    return output_file
+
+
+def test_fetch_leaves_other_runs_fingerprints_alone(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first_run = store(cache_dir, tmp_path, "a", 100)
+    entry = os.path.join(cache_dir, "a.tsv")
+    os.utime(entry, (1_000_000, 1_000_000))
+    fingerprint = triqler_runner.RunManifest.fingerprint(first_run)
+
+    second_run = str(tmp_path / "second.tsv")
+    assert triqler_runner.fetch_cached_conversion(cache_dir, "a", second_run)
+
+    assert triqler_runner.RunManifest.fingerprint(first_run) == fingerprint
+    assert os.path.samefile(first_run, second_run)
+
+
+def test_eviction_follows_last_use(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    store(cache_dir, tmp_path, "a", 100)
+    store(cache_dir, tmp_path, "b", 100)
+    for key, used in (("a", 1_000_000), ("b", 2_000_000)):
+        os.utime(os.path.join(cache_dir, key + ".tsv.used"), (used, used))
+    # Using a makes b the least recently used entry
+    assert triqler_runner.fetch_cached_conversion(cache_dir, "a", str(tmp_path / "run.tsv"))
+
+    store(cache_dir, tmp_path, "c", 100, max_bytes=250)
+
+    assert sorted(os.listdir(cache_dir)) == ["a.tsv", "a.tsv.used", "c.tsv", "c.tsv.used"]
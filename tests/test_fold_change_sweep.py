@@ -0,0 +1,104 @@
+"""The fold change sweep derived from synthetic fold change posteriors."""
+
+import csv
+import os
+
+import numpy as np
+
+import triqler_runner
+
+# Grid points sit between the thresholds, so no probability mass lies exactly on one
+GRID = np.arange(-30, 31) * 0.1 + 0.05
+PRIMARY = 1.0
+
+
+def expected_columns(distributions, threshold):
+    diff = distributions[:, np.abs(GRID) > threshold].sum(axis=1)
+    peps = 1.0 - diff
+    order = np.argsort(peps, kind="stable")
+    qvalues = np.empty_like(peps)
+    qvalues[order] = np.cumsum(peps[order]) / np.arange(1, len(peps) + 1)
+    return diff, peps, qvalues
+
+
+def write_triqler_outputs(output_dir, proteins=200, seed=0, duplicate_protein=False):
+    rng = np.random.default_rng(seed)
+    names = [f"P{i:05d}" for i in range(proteins)]
+    centers = rng.normal(0, 1.5, proteins)
+    distributions = np.exp(-0.5 * ((GRID[None, :] - centers[:, None]) / rng.uniform(0.2, 1.0, (proteins, 1))) ** 2)
+    distributions /= distributions.sum(axis=1, keepdims=True)
+
+    posteriors_file = os.path.join(output_dir, "fold_change_posteriors.tsv")
+    with open(posteriors_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(["protein"] + [f"{x:.2f}" for x in GRID])
+        for name, dist in zip(names, distributions):
+            writer.writerow([name] + [f"{p:.17g}" for p in dist])
+        if duplicate_protein:
+            writer.writerow([names[0]] + [f"{p:.17g}" for p in distributions[0]])
+
+    diff, peps, qvalues = expected_columns(distributions, PRIMARY)
+    protein_file = os.path.join(output_dir, "proteins.tsv")
+    with open(protein_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(["q_value", "posterior_error_prob", "protein", "num_peptides",
+                         "log2_fold_change", f"diff_exp_prob_{PRIMARY}", "peptides"])
+        for i in np.argsort(peps, kind="stable"):
+            writer.writerow([f"{qvalues[i]:.6g}", f"{peps[i]:.6g}", names[i], 3,
+                             f"{centers[i]:.4f}", f"{diff[i]:.6g}", f"PEP{i}A;PEP{i}B"])
+    return protein_file, posteriors_file, dict(zip(names, distributions))
+
+
+def read_sweep(sweep_file):
+    with open(sweep_file, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f, delimiter="\t")
+        header = next(reader)
+        return header, {row[header.index("protein")]: row for row in reader}
+
+
+def test_sweep_matches_posterior_mass_beyond_each_threshold(tmp_path):
+    output_dir = str(tmp_path)
+    protein_file, posteriors_file, distributions = write_triqler_outputs(output_dir)
+    thresholds = [0.5, PRIMARY, 2.0]
+
+    assert triqler_runner.write_fold_change_sweep(protein_file, posteriors_file, thresholds, output_dir)
+
+    names = list(distributions)
+    stacked = np.array([distributions[name] for name in names])
+    for threshold in thresholds:
+        header, rows = read_sweep(triqler_runner.fold_change_sweep_file(output_dir, threshold))
+        assert header[5] == f"diff_exp_prob_{threshold}"
+        assert sorted(rows) == sorted(names)
+        diff, peps, qvalues = expected_columns(stacked, threshold)
+        for i, name in enumerate(names):
+            row = rows[name]
+            np.testing.assert_allclose([float(row[5]), float(row[1]), float(row[0])],
+                                       [diff[i], peps[i], qvalues[i]], rtol=1e-5, atol=1e-9)
+            assert row[6] == f"PEP{i}A;PEP{i}B"
+
+    # Like Triqler's own output, the rows are ordered by posterior error probability
+    _, primary_rows = read_sweep(triqler_runner.fold_change_sweep_file(output_dir, PRIMARY))
+    _, triqler_rows = read_sweep(protein_file)
+    assert list(primary_rows) == list(triqler_rows)
+
+
+def test_nothing_is_written_when_triqler_columns_are_not_reproduced(tmp_path):
+    output_dir = str(tmp_path)
+    protein_file, posteriors_file, _ = write_triqler_outputs(output_dir)
+    with open(protein_file, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    fields = lines[1].split("\t")
+    fields[5] = "0.123"
+    lines[1] = "\t".join(fields)
+    with open(protein_file, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+    assert not triqler_runner.write_fold_change_sweep(protein_file, posteriors_file, [0.5], output_dir)
+    assert not os.path.exists(triqler_runner.fold_change_sweep_file(output_dir, 0.5))
+
+
+def test_several_comparisons_are_not_swept(tmp_path):
+    output_dir = str(tmp_path)
+    protein_file, posteriors_file, _ = write_triqler_outputs(output_dir, duplicate_protein=True)
+
+    assert not triqler_runner.write_fold_change_sweep(protein_file, posteriors_file, [0.5], output_dir)
@@ -0,0 +1,87 @@
+"""The SQLite gene name cache, with a stub fetcher in place of UniProt."""
+
+import sqlite3
+
+import triqler_runner
+
+
+class StubFetcher:
+    """Answers from a fixed mapping and records which accessions were asked for."""
+
+    def __init__(self, names):
+        self.names = names
+        self.calls = []
+
+    def __call__(self, accessions):
+        accessions = list(accessions)
+        self.calls.append(accessions)
+        return {acc: self.names.get(acc, "") for acc in accessions}
+
+
+def lookup(cache_file, accessions, fetcher, ttl_days=30, max_entries=0):
+    return triqler_runner.cached_gene_names(accessions, cache_file, ttl_days, max_entries, fetcher=fetcher)
+
+
+def test_hits_are_not_fetched_again(tmp_path):
+    cache_file = str(tmp_path / "genes.sqlite")
+    fetcher = StubFetcher({"P1": "GENEA", "P2": "GENEB"})
+
+    assert lookup(cache_file, ["P1", "P2"], fetcher) == {"P1": "GENEA", "P2": "GENEB"}
+    assert lookup(cache_file, ["P1", "P2", "P3"], fetcher) == {"P1": "GENEA", "P2": "GENEB"}
+    assert fetcher.calls == [["P1", "P2"], ["P3"]]
+
+
+def test_accessions_without_gene_are_cached(tmp_path):
+    cache_file = str(tmp_path / "genes.sqlite")
+    fetcher = StubFetcher({"P1": "GENEA"})
+
+    assert lookup(cache_file, ["P1", "P2"], fetcher) == {"P1": "GENEA"}
+    assert lookup(cache_file, ["P1", "P2"], fetcher) == {"P1": "GENEA"}
+    assert fetcher.calls == [["P1", "P2"]]
+
+
+def test_expired_entries_are_refreshed(tmp_path):
+    cache_file = str(tmp_path / "genes.sqlite")
+    lookup(cache_file, ["P1", "P2"], StubFetcher({"P1": "OLDA", "P2": "OLDB"}))
+    with sqlite3.connect(cache_file) as conn:
+        conn.execute("UPDATE gene_names SET fetched = fetched - 2 * 86400 WHERE accession = 'P1'")
+
+    fetcher = StubFetcher({"P1": "NEWA", "P2": "NEWB"})
+    assert lookup(cache_file, ["P1", "P2"], fetcher, ttl_days=1) == {"P1": "NEWA", "P2": "OLDB"}
+    assert fetcher.calls == [["P1"]]
+
+
+def test_expired_entries_are_used_when_the_fetch_fails(tmp_path):
+    cache_file = str(tmp_path / "genes.sqlite")
+    lookup(cache_file, ["P1"], StubFetcher({"P1": "OLDA"}))
+    with sqlite3.connect(cache_file) as conn:
+        conn.execute("UPDATE gene_names SET fetched = fetched - 2 * 86400")
+
+    assert lookup(cache_file, ["P1"], lambda accessions: None, ttl_days=1) == {"P1": "OLDA"}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache_file = str(tmp_path / "genes.sqlite")
+    names = {"P1": "GENEA", "P2": "GENEB", "P3": "GENEC"}
+    lookup(cache_file, ["P1", "P2"], StubFetcher(names), max_entries=2)
+    with sqlite3.connect(cache_file) as conn:
+        conn.execute("UPDATE gene_names SET used = used - 60 WHERE accession = 'P1'")
+
+    lookup(cache_file, ["P3"], StubFetcher(names), max_entries=2)
+    with sqlite3.connect(cache_file) as conn:
+        kept = sorted(acc for acc, in conn.execute("SELECT accession FROM gene_names"))
+    assert kept == ["P2", "P3"]
+
+
+def test_failed_store_reuses_the_fetched_names(tmp_path):
+    cache_file = str(tmp_path / "genes.sqlite")
+    stub = StubFetcher({"P1": "GENEA", "P2": "GENEB"})
+
+    def fetch_then_break_cache(accessions):
+        names = stub(accessions)
+        with sqlite3.connect(cache_file) as conn:
+            conn.execute("DROP TABLE gene_names")
+        return names
+
+    assert lookup(cache_file, ["P1", "P2"], fetch_then_break_cache) == {"P1": "GENEA", "P2": "GENEB"}
+    assert stub.calls == [["P1", "P2"]]
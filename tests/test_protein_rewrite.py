@@ -0,0 +1,125 @@
+"""The single-pass protein file rewrite must write exactly what the csv.DictReader based
+cleanup_protein_files followed by add_gene_names used to write."""
+
+import csv
+import random
+
+import pytest
+
+import triqler_runner
+
+HEADER = ["q_value", "posterior_error_prob", "protein", "num_peptides", "protein_id_posterior_error_prob",
+          "log2_fold_change", "diff_exp_prob_0.5", "A", "B", "peptides"]
+GENE_NAMES = {"P00001": "GENEA", "P00002": "GENEB", "P00003": "GENEA", "P00004": "GEN\tTAB", "P00005": 'GEN"Q'}
+RAW_TO_CLEAN = {f"sp|P0000{i}|NAME{i}_HUMAN": f"P0000{i}" for i in range(1, 6)}
+
+
+def baseline_cleanup(file_path, output_file):
+    """cleanup_protein_files of the baseline, for a single file."""
+    with open(file_path, "r", encoding="utf-8") as f_in, \
+         open(output_file, "w", encoding="utf-8", newline="") as f_out:
+        reader = csv.DictReader(f_in, delimiter="\t")
+        writer = csv.DictWriter(f_out, fieldnames=reader.fieldnames, delimiter="\t", extrasaction="ignore")
+        writer.writeheader()
+        for row in reader:
+            extras = row.get(None, [])
+            if extras and "peptides" in row:
+                clean_extras = [x.strip() for x in extras if x and x.strip()]
+                if clean_extras:
+                    row["peptides"] = row["peptides"] + ";" + ";".join(clean_extras)
+            writer.writerow(row)
+
+
+def baseline_add_gene_names(file_path, output_file, mapping, raw_to_clean):
+    """The file rewrite of the baseline add_gene_names, for a single file."""
+    with open(file_path, "r", encoding="utf-8") as f_in, \
+         open(output_file, "w", encoding="utf-8", newline="") as f_out:
+        reader = csv.DictReader(f_in, delimiter="\t")
+        fieldnames = list(reader.fieldnames)
+        prot_idx = fieldnames.index("protein")
+        new_fieldnames = fieldnames[:prot_idx + 1] + ["gene_name"] + fieldnames[prot_idx + 1:]
+        writer = csv.DictWriter(f_out, fieldnames=new_fieldnames, delimiter="\t")
+        writer.writeheader()
+        for row in reader:
+            genes = []
+            for r_acc in row["protein"].split(";"):
+                g = mapping.get(raw_to_clean.get(r_acc, r_acc), "")
+                if g and g not in genes:
+                    genes.append(g)
+            row["gene_name"] = ";".join(genes)
+            writer.writerow(row)
+
+
+def random_field(rng):
+    kind = rng.random()
+    if kind < 0.3:
+        return ";".join(rng.choice(["sp|P00001|NAME1_HUMAN", "P00002", "sp|P00003|NAME3_HUMAN",
+                                    "P00004", "P00005", "decoy_P00001", "Q99999"])
+                        for _ in range(rng.randint(1, 3)))
+    if kind < 0.5:
+        return f"{rng.uniform(0, 1):.6g}"
+    if kind < 0.6:
+        return ""
+    if kind < 0.7:
+        return rng.choice([" ", "  PEPT ", "\t"])
+    if kind < 0.8:
+        return rng.choice(['a"b', '"quoted"', "two\tfields", "two\nlines", "x\t\ny", "cr\r\nlf", "cr\ronly"])
+    return "".join(rng.choice("ACDEFGHIKLMNPQRSTVWY") for _ in range(rng.randint(5, 15)))
+
+
+def encode_field(field, rng):
+    if any(c in field for c in '\t"\r\n') or rng.random() < 0.05:
+        return '"' + field.replace('"', '""') + '"'
+    return field
+
+
+def write_protein_file(path, line_ending, rng, rows=300):
+    lines = ["\t".join(HEADER)]
+    for _ in range(rows):
+        shape = rng.random()
+        if shape < 0.6:
+            width = len(HEADER)
+        elif shape < 0.8:
+            # Peptides spilling into extra columns
+            width = len(HEADER) + rng.randint(1, 4)
+        elif shape < 0.95:
+            width = rng.randint(1, len(HEADER) - 1)
+        else:
+            lines.append("")
+            continue
+        lines.append("\t".join(encode_field(random_field(rng), rng) for _ in range(width)))
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(line_ending.join(lines) + line_ending)
+
+
+@pytest.mark.parametrize("line_ending", ["\n", "\r\n", "\r"])
+@pytest.mark.parametrize("with_genes", [False, True])
+@pytest.mark.parametrize("seed", range(5))
+def test_rewrite_matches_baseline(tmp_path, line_ending, with_genes, seed):
+    protein_file = str(tmp_path / "proteins.tsv")
+    write_protein_file(protein_file, line_ending, random.Random(seed))
+
+    expected_file = str(tmp_path / "expected.tsv")
+    baseline_cleanup(protein_file, expected_file)
+    if with_genes:
+        cleaned_file = str(tmp_path / "cleaned.tsv")
+        baseline_cleanup(protein_file, cleaned_file)
+        baseline_add_gene_names(cleaned_file, expected_file, GENE_NAMES, RAW_TO_CLEAN)
+
+    actual_file = str(tmp_path / "actual.tsv")
+    gene_names = GENE_NAMES if with_genes else None
+    assert triqler_runner.postprocess_protein_file(protein_file, gene_names, RAW_TO_CLEAN, actual_file)
+
+    with open(expected_file, "rb") as f:
+        expected = f.read()
+    with open(actual_file, "rb") as f:
+        assert f.read() == expected
+
+
+def test_regular_file_is_left_alone_without_genes(tmp_path):
+    protein_file = str(tmp_path / "proteins.tsv")
+    with open(protein_file, "w", encoding="utf-8", newline="") as f:
+        f.write("\t".join(HEADER) + "\r\n" + "\t".join(["x"] * len(HEADER)) + "\r\n")
+
+    assert not triqler_runner.postprocess_protein_file(protein_file, None, {}, str(tmp_path / "actual.tsv"))
+    assert not (tmp_path / "actual.tsv").exists()
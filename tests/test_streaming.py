@@ -0,0 +1,67 @@
+"""The streamed DIA-NN conversion must produce the same Triqler input as the in-memory one."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import triqler_runner
+
+MEMORY_LIMIT_MB = 1
+
+
+def write_report(path, rows=40000, runs=6, seed=0):
+    rng = np.random.default_rng(seed)
+    peptides = rng.integers(0, 5000, rows)
+    report = pd.DataFrame({
+        "File.Name": "report",
+        "Run": [f"run{i}" for i in rng.integers(0, runs, rows)],
+        "Protein.Group": [f"P{p % 800:05d};Q{p % 97:05d}" if p % 5 == 0 else f"P{p % 800:05d}" for p in peptides],
+        "Modified.Sequence": [f"PEPTIDE{p}K" for p in peptides],
+        "Precursor.Charge": rng.integers(2, 5, rows),
+        "Q.Value": rng.uniform(0, 0.02, rows),
+        "Precursor.Normalised": np.where(rng.random(rows) < 0.05, 0.0, rng.lognormal(10, 2, rows)),
+        "Decoy": (rng.random(rows) < 0.1).astype(int),
+    })
+    if path.endswith(".parquet"):
+        report.to_parquet(path, index=False)
+    else:
+        report.to_csv(path, sep="\t", index=False)
+
+
+@pytest.mark.parametrize("report_name", ["report.tsv", "report.parquet"])
+def test_streamed_conversion_matches_in_memory(tmp_path, report_name):
+    report_file = str(tmp_path / report_name)
+    write_report(report_file)
+    run_conditions = {f"run{i}": "A" if i < 3 else "B" for i in range(5)}
+
+    in_memory_file = str(tmp_path / "in_memory.tsv")
+    streamed_file = str(tmp_path / "streamed.tsv")
+    triqler_runner.convert_diann_report(report_file, run_conditions, in_memory_file, "decoy_", 0.01)
+    triqler_runner.convert_diann_report(
+        report_file, run_conditions, streamed_file, "decoy_", 0.01, memory_limit_mb=MEMORY_LIMIT_MB,
+    )
+
+    # The loaded report must exceed the ceiling, or nothing is streamed in batches
+    loaded = triqler_runner.read_diann_report(report_file, 1.0)
+    assert loaded.memory_usage(deep=True).sum() > MEMORY_LIMIT_MB * 1024 * 1024
+    batch_rows = triqler_runner.stream_batch_rows(report_file, list(loaded.columns), MEMORY_LIMIT_MB)
+    assert batch_rows < len(loaded)
+
+    with open(in_memory_file, "rb") as f_in_memory, open(streamed_file, "rb") as f_streamed:
+        assert f_streamed.read() == f_in_memory.read()
+
+
+def test_arrow_intermediate_materializes_the_same_tsv(tmp_path):
+    report_file = str(tmp_path / "report.tsv")
+    write_report(report_file, rows=5000)
+    run_conditions = {f"run{i}": "A" if i < 3 else "B" for i in range(6)}
+
+    tsv_file = str(tmp_path / "direct.tsv")
+    arrow_file = str(tmp_path / "triqler_input.arrows")
+    materialized_file = str(tmp_path / "materialized.tsv")
+    triqler_runner.convert_diann_report(report_file, run_conditions, tsv_file, "decoy_", 0.01)
+    triqler_runner.convert_diann_report(report_file, run_conditions, arrow_file, "decoy_", 0.01)
+    triqler_runner.arrow_to_triqler_tsv(arrow_file, materialized_file)
+
+    with open(tsv_file, "rb") as f_direct, open(materialized_file, "rb") as f_materialized:
+        assert f_materialized.read() == f_direct.read()
@@ -0,0 +1,127 @@
+"""The UniProt client against a local stand-in server that simulates latency and errors."""
+
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import triqler_runner
+
+# Bound before the tests replace time.sleep to skip the client's backoff
+server_sleep = time.sleep
+
+
+class StandInUniProt(BaseHTTPRequestHandler):
+    """Answers /uniprotkb/accessions requests, first playing any scripted failures for the batch.
+
+    plans maps the first accession of a batch to the responses to send before succeeding:
+    an HTTP status (429 comes with Retry-After) or "drop" to close the connection unanswered.
+    """
+
+    protocol_version = "HTTP/1.1"
+    plans = {}
+    requests = defaultdict(int)
+    latency = 0.01
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        accessions = parse_qs(urlsplit(self.path).query)["accessions"][0].split(",")
+        self.requests[accessions[0]] += 1
+        server_sleep(self.latency)
+        plan = self.plans.get(accessions[0], [])
+        action = plan.pop(0) if plan else 200
+        if action == "drop":
+            self.close_connection = True
+            return
+        if action != 200:
+            self.send_response(action)
+            if action == 429:
+                self.send_header("Retry-After", "30")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        # Accessions ending in 9 have no gene name; those ending in 8 were merged into
+        # an entry under a new accession that keeps them as secondary accessions
+        body = "Entry\tSecondary Accession\tGene Names (primary)\n" + "".join(
+            f"{acc}\t\tG{acc}; ALT{acc}\n" if not acc.endswith("8") else f"A{acc[1:]}\tX00001; {acc}\tG{acc}\n"
+            for acc in accessions if not acc.endswith("9")
+        )
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def uniprot(monkeypatch):
+    StandInUniProt.plans = {}
+    StandInUniProt.requests = defaultdict(int)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInUniProt)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    # Record backoff delays instead of waiting them out
+    sleeps = []
+    monkeypatch.setattr(triqler_runner.time, "sleep", sleeps.append)
+    yield f"http://127.0.0.1:{server.server_address[1]}", sleeps
+    server.shutdown()
+    server.server_close()
+
+
+def test_retries_errors_until_success(uniprot):
+    base_url, sleeps = uniprot
+    StandInUniProt.plans = {"P10001": [503, 429, "drop"]}
+
+    result = triqler_runner.fetch_gene_names(["P10001", "P10009"], base_url, retries=3)
+
+    assert result == {"P10001": "GP10001", "P10009": ""}
+    assert StandInUniProt.requests["P10001"] == 4
+    assert len(sleeps) == 3
+    # Retry-After: 30 overrides the exponential backoff, less jitter of at most half
+    assert max(sleeps) >= 15
+
+
+def test_gives_up_after_retries_and_keeps_other_batches(uniprot):
+    base_url, _ = uniprot
+    StandInUniProt.plans = {"P20001": [503] * 10}
+
+    result = triqler_runner.fetch_gene_names(
+        ["P10001", "P10002", "P20001", "P20002", "not-an-accession"], base_url, batch_size=2, retries=2,
+    )
+
+    # The failed batch is left out rather than recorded as having no gene name
+    assert result == {"P10001": "GP10001", "P10002": "GP10002", "not-an-accession": ""}
+    assert StandInUniProt.requests["P20001"] == 3
+
+
+def test_client_errors_are_not_retried(uniprot):
+    base_url, sleeps = uniprot
+    StandInUniProt.plans = {"P10001": [404]}
+
+    assert triqler_runner.fetch_gene_names(["P10001"], base_url, retries=3) is None
+    assert StandInUniProt.requests["P10001"] == 1
+    assert not sleeps
+
+
+def test_returns_none_only_when_every_batch_fails(uniprot):
+    base_url, _ = uniprot
+    StandInUniProt.plans = {"P10001": [503] * 10, "P20001": ["drop"] * 10}
+
+    assert triqler_runner.fetch_gene_names(["P10001", "P20001"], base_url, batch_size=1, retries=1) is None
+    assert StandInUniProt.requests["P10001"] == 2
+    assert StandInUniProt.requests["P20001"] == 2
+    assert triqler_runner.fetch_gene_names(["not-an-accession"], base_url) == {"not-an-accession": ""}
+
+
+def test_merged_accessions_map_back_to_the_submitted_one(uniprot):
+    base_url, _ = uniprot
+
+    result = triqler_runner.fetch_gene_names(["P10001", "P10008"], base_url)
+
+    assert result == {"P10001": "GP10001", "P10008": "GP10008"}
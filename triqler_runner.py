@@ -6,40 +6,621 @@ import shutil
 import subprocess
 import glob
 import csv
-from io import StringIO
-from typing import Optional
+import fcntl
+import hashlib
+import http.client
+import itertools
+import json
+import mmap
+import multiprocessing
+import random
+import runpy
+import re
+import resource
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from importlib import metadata
+from io import TextIOWrapper
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from urllib.parse import urlencode, urlsplit
 
 import click
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 
 
-def convert_diann_to_triqler(
+TRIQLER_COLUMNS = ["run", "condition", "charge", "searchScore", "intensity", "peptide", "proteins"]
+
+# Leading bytes of the compressed input formats, mapped to their pyarrow codec names
+COMPRESSION_MAGIC = {
+    b"\x1f\x8b": "gzip",
+    b"\x28\xb5\x2f\xfd": "zstd",
+    b"BZh": "bz2",
+}
+
+CONDITION_SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+
+# DIA-NN report columns needed for the Triqler input; intensity columns in order of preference
+DIANN_REQUIRED_COLUMNS = ["Run", "Protein.Group", "Modified.Sequence", "Precursor.Charge", "Q.Value"]
+DIANN_INTENSITY_COLUMNS = ["Precursor.Normalised", "Precursor.Quantity"]
+DIANN_OPTIONAL_COLUMNS = ["Decoy"]
+DIANN_MIN_QVALUE = 1e-16
+
+# MaxQuant evidence.txt columns needed for the Triqler input, with their parse types
+MAXQUANT_COLUMN_TYPES = {
+    "Raw file": pa.dictionary(pa.int32(), pa.string()),
+    "Charge": pa.int32(),
+    "Score": pa.float64(),
+    "Intensity": pa.float64(),
+    "Modified sequence": pa.dictionary(pa.int32(), pa.string()),
+    "Proteins": pa.dictionary(pa.int32(), pa.string()),
+}
+MAXQUANT_OPTIONAL_COLUMN_TYPES = {"Reverse": pa.string()}
+MAXQUANT_BLOCK_SIZE = 64 * 1024 * 1024
+
+# Streaming conversion: a parsed batch plus its converted copy take roughly this many
+# times the batch's on-disk size in memory
+STREAM_MEMORY_FACTOR = 4
+STREAM_MIN_BATCH_ROWS = 1000
+
+# Binary intermediate: an Arrow IPC stream (which, unlike the IPC file format, allows each
+# streamed batch to carry its own dictionaries) with dictionary-encoded string columns
+ARROW_INPUT_SUFFIX = ".arrows"
+TRIQLER_ARROW_SCHEMA = pa.schema([
+    ("run", pa.dictionary(pa.int32(), pa.string())),
+    ("condition", pa.dictionary(pa.int32(), pa.string())),
+    ("charge", pa.int32()),
+    ("searchScore", pa.float64()),
+    ("intensity", pa.float64()),
+    ("peptide", pa.dictionary(pa.int32(), pa.string())),
+    ("proteins", pa.dictionary(pa.int32(), pa.string())),
+])
+
+# Bump when the in-process conversion changes its output so cached conversions are invalidated
+CONVERTER_VERSION = "3"
+# Empty file next to each cached conversion whose modification time records its last use
+CONVERSION_CACHE_USED_SUFFIX = ".used"
+# Linux ioctl request for cloning file extents (reflink)
+FICLONE = 0x40049409
+GENE_ANNOTATIONS_FILE = "gene_annotations.tsv"
+# Largest difference from Triqler's own values accepted when re-deriving its statistics
+FOLD_CHANGE_SWEEP_TOLERANCE = 1e-3
+RUN_MANIFEST_FILE = "run_manifest.json"
+RUN_MANIFEST_VERSION = 2
+# Pipeline stages in run order; a stage's outputs may be rewritten in place by later stages
+RUN_STAGES = ["convert", "condition_mapping", "triqler", "postprocess"]
+RUN_METRICS_FILE = "run_metrics.json"
+PROGRESS_FILE = "progress.json"
+PROGRESS_WRITE_INTERVAL = 1.0
+# Triqler reports per-protein progress as lines starting with 'done / total'
+TRIQLER_PROGRESS_PATTERN = re.compile(r"^\s*(\d+)\s*/\s*(\d+)\b")
+# Rough Triqler memory model used to size the worker pool: the main process holds the parsed
+# input, every worker a fixed overhead plus its share of pages touched after the fork
+TRIQLER_MAIN_MEMORY_FACTOR = 4
+TRIQLER_WORKER_MEMORY_FACTOR = 1
+TRIQLER_WORKER_BASE_BYTES = 256 * 1024 * 1024
+CGROUP_ROOT = "/sys/fs/cgroup"
+# cgroup v1 reports "no limit" as a huge page-aligned value
+CGROUP_V1_UNLIMITED = 1 << 62
+# Characters that make csv.writer quote a tab-delimited field
+CSV_QUOTED_CHARACTERS = re.compile(r'[\t"\r\n]')
+# RE2 patterns used by normalize_accessions
+UNIPROT_ISOFORM_PATTERN = r"^([OPQ][0-9][A-Z0-9]{3}[0-9]|[A-NR-Z][0-9](?:[A-Z][A-Z0-9]{2}[0-9]){1,2})-[0-9]+$"
+ACCESSION_VERSION_PATTERN = r"^([A-Z]{2}_[0-9]+|ENS[A-Z]*[EGPT][0-9]{11})\.[0-9]+$"
+UNIPROT_URL = "https://rest.uniprot.org"
+# The accessions endpoint returns at most this many entries per request
+UNIPROT_MAX_BATCH_SIZE = 500
+UNIPROT_ACCESSION_PATTERN = re.compile(
+    r"^(?:[OPQ][0-9][A-Z0-9]{3}[0-9]|[A-NR-Z][0-9](?:[A-Z][A-Z0-9]{2}[0-9]){1,2})(?:-[0-9]+)?$"
+)
+FASTA_INDEX_SUFFIX = ".genes.idx"
+FASTA_INDEX_MAGIC = "#triqler-gene-index 2"
+FASTA_GENE_PATTERN = re.compile(r"(?:\bGN=|\bgene_symbol:)(\S+)")
+# Host parameter limit of older SQLite builds
+GENE_CACHE_QUERY_CHUNK = 900
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """Returns the codec of a gzip/zstd/bz2 compressed file from its magic bytes, or None."""
+    with open(path, "rb") as f:
+        head = f.read(4)
+    return next((codec for magic, codec in COMPRESSION_MAGIC.items() if head.startswith(magic)), None)
+
+
+def open_input_stream(path: str) -> BinaryIO:
+    """Opens an input file for binary reading, decompressing gzip/zstd/bz2 on the fly.
+
+    Decompression streams through pyarrow, so no decompressed copy is written to disk.
+    """
+    codec = detect_compression(path)
+    if codec is None:
+        return open(path, "rb")
+    return pa.CompressedInputStream(pa.OSFile(path, "rb"), codec)
+
+
+def open_text_input(path: str) -> TextIO:
+    """Opens a possibly compressed input file for reading as UTF-8 text."""
+    return TextIOWrapper(open_input_stream(path), encoding="utf-8")
+
+
+def read_tsv_header(path: str) -> List[str]:
+    """Returns the column names on the first line of a possibly compressed tab-separated file."""
+    with open_text_input(path) as f:
+        return f.readline().rstrip("\r\n").split("\t")
+
+
+def iter_file_list(file_list_file: str) -> Iterator[List[str]]:
+    """Yields the fields (run, condition, [sample], [fraction]) of every run mapping line."""
+    with open_text_input(file_list_file) as f:
+        for line in f:
+            parts = [p.strip() for p in line.rstrip("\r\n").split("\t")]
+            if len(parts) < 2 or not parts[0]:
+                continue
+            yield parts
+
+
+def read_file_list(file_list_file: str) -> Dict[str, str]:
+    """Reads the run mapping file (no header) into a run -> condition dictionary."""
+    run_conditions = {parts[0]: parts[1] for parts in iter_file_list(file_list_file)}
+    if not run_conditions:
+        raise RuntimeError(f"No run to condition mappings found in {file_list_file}")
+    return run_conditions
+
+
+def read_run_samples(file_list_file: str) -> Dict[str, str]:
+    """Reads the run -> sample dictionary from the optional sample column of the run mapping file.
+
+    As in Triqler's own converters, the sample becomes the Triqler run, so fractions of one
+    sample are pooled into a single run. Runs without a sample keep their own name.
+    """
+    run_samples = {}
+    sample_conditions = {}
+    for parts in iter_file_list(file_list_file):
+        sample = parts[2] if len(parts) > 2 and parts[2] else parts[0]
+        if sample_conditions.setdefault(sample, parts[1]) != parts[1]:
+            raise RuntimeError(f"Sample {sample} is mapped to both conditions {sample_conditions[sample]} "
+                               f"and {parts[1]} in {file_list_file}")
+        run_samples[parts[0]] = sample
+    return run_samples
+
+
+def diann_report_columns(available: Iterable[str]) -> List[str]:
+    """Selects the DIA-NN report columns to load, failing early if required ones are missing."""
+    available = set(available)
+    missing = [c for c in DIANN_REQUIRED_COLUMNS if c not in available]
+    if missing:
+        raise RuntimeError(f"DIA-NN report is missing required columns: {', '.join(missing)}")
+    intensity_col = next((c for c in DIANN_INTENSITY_COLUMNS if c in available), None)
+    if intensity_col is None:
+        raise RuntimeError(f"DIA-NN report has none of the intensity columns {DIANN_INTENSITY_COLUMNS}")
+    return DIANN_REQUIRED_COLUMNS + [intensity_col] + [c for c in DIANN_OPTIONAL_COLUMNS if c in available]
+
+
+def read_diann_report(input_file: str, qvalue_threshold: float) -> pd.DataFrame:
+    """Loads the needed columns of a DIA-NN report.tsv or report.parquet, keeping precursors
+    with a q-value at or below the threshold.
+
+    Parquet reports are scanned through pyarrow.dataset so only the projected columns are
+    decoded and the q-value filter is applied during the scan, skipping row groups whose
+    statistics rule them out.
+    """
+    if input_file.lower().endswith(".parquet"):
+        dataset = ds.dataset(input_file, format="parquet")
+        table = dataset.to_table(
+            columns=diann_report_columns(dataset.schema.names),
+            filter=pc.field("Q.Value") <= qvalue_threshold,
+        )
+        return table.to_pandas()
+
+    with open_input_stream(input_file) as f:
+        report = pd.read_csv(
+            f, sep="\t", usecols=diann_report_columns(read_tsv_header(input_file)),
+            dtype={"Run": str, "Protein.Group": str},
+        )
+    return report[report["Q.Value"] <= qvalue_threshold]
+
+
+def diann_to_triqler_frame(
+    report: pd.DataFrame,
+    run_conditions: Dict[str, str],
+    decoy_pattern: str,
+    run_samples: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    """Maps DIA-NN precursor rows onto the Triqler input columns.
+
+    The search score is -log10 of the precursor q-value, protein groups are kept as a
+    single semicolon-separated entry and rows flagged in the 'Decoy' column (if present)
+    get each of their proteins prefixed with the decoy pattern. With run_samples, runs are
+    renamed to their sample (see read_run_samples).
+    """
+    intensity_col = next((c for c in DIANN_INTENSITY_COLUMNS if c in report.columns), None)
+    if intensity_col is None:
+        raise RuntimeError(f"DIA-NN report has none of the intensity columns {DIANN_INTENSITY_COLUMNS}")
+
+    in_mapping = report["Run"].isin(run_conditions.keys())
+    if not in_mapping.all():
+        report = report[in_mapping]
+
+    proteins = report["Protein.Group"].astype(str)
+    if "Decoy" in report.columns:
+        is_decoy = report["Decoy"].fillna(0).astype(bool)
+        decoy_proteins = decoy_pattern + proteins.str.replace(";", ";" + decoy_pattern, regex=False)
+        proteins = proteins.where(~is_decoy, decoy_proteins)
+
+    runs = report["Run"].astype(str)
+    frame = pd.DataFrame({
+        "run": runs.map(run_samples) if run_samples else runs,
+        "condition": report["Run"].map(run_conditions),
+        "charge": report["Precursor.Charge"].astype(int),
+        "searchScore": -np.log10(report["Q.Value"].clip(lower=DIANN_MIN_QVALUE)),
+        "intensity": report[intensity_col],
+        "peptide": report["Modified.Sequence"].astype(str),
+        "proteins": proteins,
+    }, columns=TRIQLER_COLUMNS)
+
+    # Triqler cannot use missing or zero intensities
+    return frame[frame["intensity"] > 0].reset_index(drop=True)
+
+
+def subsample_decoys(frame: pd.DataFrame, decoy_pattern: str, decoy_fraction: float) -> pd.DataFrame:
+    """Keeps a deterministic fraction of the decoy proteins, with all of their rows.
+
+    Decoys are selected by a hash of their protein entry, so the selection is identical
+    across batches, parts and reruns.
+    """
+    if decoy_fraction >= 1.0 or frame.empty:
+        return frame
+    is_decoy = frame["proteins"].astype(str).str.startswith(decoy_pattern)
+    buckets = pd.util.hash_pandas_object(frame["proteins"].astype(str), index=False).to_numpy() % (1 << 32)
+    keep = ~is_decoy.to_numpy() | (buckets < decoy_fraction * (1 << 32))
+    return frame[keep].reset_index(drop=True)
+
+
+def warn_unmapped_runs(runs: Iterable[str], run_conditions: Dict[str, str]) -> None:
+    """Warns about report runs that are missing from the run mapping file."""
+    missing = sorted(str(r) for r in set(runs) if r not in run_conditions)
+    if missing:
+        print(f"Warning: Skipping {len(missing)} runs not listed in the run mapping file: "
+              f"{', '.join(missing[:5])}{' ...' if len(missing) > 5 else ''}", file=sys.stderr)
+
+
+class TriqlerInputWriter:
+    """Writes converted Triqler input frames, as TSV or as an Arrow IPC stream for '.arrows' paths."""
+
+    def __init__(self, output_file: str):
+        self.output_file = output_file
+        self.rows = 0
+        self._arrow_writer = None
+
+    def write(self, frame: pd.DataFrame) -> None:
+        if self.output_file.endswith(ARROW_INPUT_SUFFIX):
+            table = pa.Table.from_pandas(frame[TRIQLER_COLUMNS], preserve_index=False)
+            if self._arrow_writer is None:
+                self._arrow_writer = pa.ipc.new_stream(self.output_file, TRIQLER_ARROW_SCHEMA)
+            self._arrow_writer.write_table(table.cast(TRIQLER_ARROW_SCHEMA))
+        else:
+            append = self.rows > 0
+            frame.to_csv(self.output_file, sep="\t", index=False, mode="a" if append else "w", header=not append)
+        self.rows += len(frame)
+
+    def close(self) -> None:
+        if self._arrow_writer is not None:
+            self._arrow_writer.close()
+            self._arrow_writer = None
+
+    def __enter__(self) -> "TriqlerInputWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_triqler_arrow(input_file: str, columns: Optional[List[str]] = None) -> pa.Table:
+    """Reads an Arrow intermediate through a memory map, so column buffers are not copied."""
+    with pa.memory_map(input_file, "r") as source:
+        table = pa.ipc.open_stream(source).read_all()
+    return table.select(columns) if columns else table
+
+
+def arrow_to_triqler_tsv(input_file: str, output_file: str) -> None:
+    """Materializes an Arrow intermediate as the tab-separated file Triqler parses."""
+    with pa.memory_map(input_file, "r") as source, TriqlerInputWriter(output_file) as writer:
+        for batch in pa.ipc.open_stream(source):
+            writer.write(batch.to_pandas())
+
+
+def stream_batch_rows(input_file: str, columns: List[str], memory_limit_mb: int) -> int:
+    """Estimates how many report rows fit into one streaming batch under the memory ceiling."""
+    if input_file.lower().endswith(".parquet"):
+        parquet_metadata = pq.ParquetFile(input_file).metadata
+        schema_names = [parquet_metadata.schema.column(i).name for i in range(parquet_metadata.num_columns)]
+        selected = [i for i, name in enumerate(schema_names) if name in columns]
+        size = sum(
+            parquet_metadata.row_group(rg).column(i).total_uncompressed_size
+            for rg in range(parquet_metadata.num_row_groups) for i in selected
+        )
+        bytes_per_row = size / max(parquet_metadata.num_rows, 1)
+    else:
+        with open_input_stream(input_file) as f:
+            sample = f.read(1 << 20)
+        # Skip the header line
+        sample = sample[sample.find(b"\n") + 1:]
+        bytes_per_row = len(sample) / max(sample.count(b"\n"), 1)
+
+    budget = memory_limit_mb * 1024 * 1024 / STREAM_MEMORY_FACTOR
+    return max(STREAM_MIN_BATCH_ROWS, int(budget / max(bytes_per_row, 1)))
+
+
+def iter_diann_report(
+    input_file: str,
+    qvalue_threshold: float,
+    memory_limit_mb: int,
+) -> Iterator[pd.DataFrame]:
+    """Yields a DIA-NN report in batches sized to stay under the memory ceiling.
+
+    Applies the same column projection and q-value filter as read_diann_report.
+    """
+    if input_file.lower().endswith(".parquet"):
+        dataset = ds.dataset(input_file, format="parquet")
+        columns = diann_report_columns(dataset.schema.names)
+        batches = dataset.to_batches(
+            columns=columns,
+            filter=pc.field("Q.Value") <= qvalue_threshold,
+            batch_size=stream_batch_rows(input_file, columns, memory_limit_mb),
+            batch_readahead=1,
+            fragment_readahead=1,
+        )
+        for batch in batches:
+            yield batch.to_pandas()
+        return
+
+    columns = diann_report_columns(read_tsv_header(input_file))
+    batch_rows = stream_batch_rows(input_file, columns, memory_limit_mb)
+    with open_input_stream(input_file) as f, pd.read_csv(
+        f, sep="\t", usecols=columns, dtype={"Run": str, "Protein.Group": str}, chunksize=batch_rows,
+    ) as reader:
+        for chunk in reader:
+            yield chunk[chunk["Q.Value"] <= qvalue_threshold]
+
+
+def stream_diann_to_triqler(
     input_file: str,
+    run_conditions: Dict[str, str],
+    output_file: str,
+    decoy_pattern: str,
+    qvalue_threshold: float,
+    memory_limit_mb: int,
+    decoy_fraction: float = 1.0,
+    run_samples: Optional[Dict[str, str]] = None,
+) -> Tuple[int, set]:
+    """Converts a DIA-NN report batch by batch, appending to the output file.
+
+    Returns the number of rows and the distinct conditions written.
+    """
+    runs = set()
+    conditions = set()
+    with TriqlerInputWriter(output_file) as writer:
+        for report in iter_diann_report(input_file, qvalue_threshold, memory_limit_mb):
+            runs.update(report["Run"].unique())
+            frame = diann_to_triqler_frame(report, run_conditions, decoy_pattern, run_samples)
+            frame = subsample_decoys(frame, decoy_pattern, decoy_fraction)
+            if not frame.empty:
+                writer.write(frame)
+                conditions.update(frame["condition"].unique())
+    warn_unmapped_runs(runs, run_conditions)
+    return writer.rows, conditions
+
+
+def convert_diann_report(
+    input_file: str,
+    run_conditions: Dict[str, str],
+    output_file: str,
+    decoy_pattern: str,
+    qvalue_threshold: float,
+    memory_limit_mb: int = 0,
+    decoy_fraction: float = 1.0,
+    run_samples: Optional[Dict[str, str]] = None,
+) -> Tuple[int, set]:
+    """Converts one DIA-NN report. Returns the number of rows and the distinct conditions written.
+
+    With a memory limit the report is streamed in batches straight into the output file.
+    """
+    if memory_limit_mb > 0:
+        print(f"Streaming conversion of {input_file} with a {memory_limit_mb} MB memory ceiling")
+        rows, conditions = stream_diann_to_triqler(
+            input_file, run_conditions, output_file, decoy_pattern, qvalue_threshold, memory_limit_mb,
+            decoy_fraction, run_samples,
+        )
+        print(f"Converted {rows} precursors from {input_file}")
+        return rows, conditions
+
+    report = read_diann_report(input_file, qvalue_threshold)
+    warn_unmapped_runs(report["Run"].unique(), run_conditions)
+    frame = diann_to_triqler_frame(report, run_conditions, decoy_pattern, run_samples)
+    frame = subsample_decoys(frame, decoy_pattern, decoy_fraction)
+    with TriqlerInputWriter(output_file) as writer:
+        writer.write(frame)
+    print(f"Converted {len(frame)} precursors from {frame['run'].nunique()} runs in {input_file}")
+    return len(frame), set(frame["condition"].unique())
+
+
+def _convert_diann_part(args: tuple) -> Tuple[int, set]:
+    """Process pool worker converting one report of a multi-report input. Returns its rows and conditions."""
+    (input_file, run_conditions, part_file, decoy_pattern, qvalue_threshold, memory_limit_mb, decoy_fraction,
+     run_samples) = args
+    return convert_diann_report(
+        input_file, run_conditions, part_file, decoy_pattern, qvalue_threshold, memory_limit_mb,
+        decoy_fraction=decoy_fraction, run_samples=run_samples,
+    )
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """Returns a process pool whose workers do not fork this process.
+
+    Forking while other threads run, e.g. the gene prefetch or pyarrow's thread pool, can
+    copy a lock another thread holds and deadlock the child, so workers are started by a
+    forkserver (or spawned where that is unavailable) instead.
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+
+def merge_triqler_inputs(part_files: List[str], output_file: str) -> None:
+    """Concatenates converted parts, in order, into a single Triqler input."""
+    if output_file.endswith(ARROW_INPUT_SUFFIX):
+        with TriqlerInputWriter(output_file) as writer:
+            for part_file in part_files:
+                with pa.memory_map(part_file, "r") as source:
+                    for batch in pa.ipc.open_stream(source):
+                        writer.write(batch.to_pandas())
+        return
+
+    with open(output_file, "wb") as f_out:
+        for idx, part_file in enumerate(part_files):
+            with open(part_file, "rb") as f_in:
+                header = f_in.readline()
+                if idx == 0:
+                    f_out.write(header)
+                shutil.copyfileobj(f_in, f_out, 16 * 1024 * 1024)
+
+
+def convert_diann_to_triqler(
+    input_files: List[str],
     file_list_file: str,
     output_file: str,
-) -> None:
-    """Convert DIA-NN output to triqler input format."""
-    cmd = [
-        sys.executable, "-m", "triqler.convert.diann",
-        input_file,
-        "--file_list_file", file_list_file,
-        "--out_file", output_file,
-    ]
-    print(f"Converting DIA-NN format: {' '.join(cmd)}")
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.stdout:
-        print(result.stdout)
-    if result.stderr:
-        print(result.stderr, file=sys.stderr)
-    if result.returncode != 0:
-        raise RuntimeError(f"DIA-NN conversion failed: {result.stderr}")
+    decoy_pattern: str,
+    qvalue_threshold: float,
+    memory_limit_mb: int = 0,
+    workers: int = 1,
+    decoy_fraction: float = 1.0,
+) -> set:
+    """Convert DIA-NN output to triqler input format in-process and return the conditions written.
 
+    Several reports are converted concurrently in a process pool, each worker writing its
+    own part, and the parts are merged into the output file. A memory limit is shared
+    between the workers.
 
-def convert_maxquant_to_triqler(
+    decoy_fraction < 1 subsamples the decoy proteins before anything is written.
+    """
+    print(f"Converting DIA-NN format: {', '.join(input_files)}")
+    run_conditions = read_file_list(file_list_file)
+    run_samples = read_run_samples(file_list_file)
+
+    if len(input_files) == 1:
+        rows, conditions = convert_diann_report(
+            input_files[0], run_conditions, output_file, decoy_pattern, qvalue_threshold, memory_limit_mb,
+            decoy_fraction, run_samples,
+        )
+        if rows == 0 or not os.path.exists(output_file):
+            raise RuntimeError("DIA-NN conversion failed: no precursors left after mapping runs to conditions")
+        return conditions
+
+    workers = max(1, min(workers, len(input_files)))
+    worker_memory_mb = max(1, memory_limit_mb // workers) if memory_limit_mb > 0 else 0
+    parts_dir = os.path.join(os.path.dirname(output_file) or ".", ".conversion_parts")
+    os.makedirs(parts_dir, exist_ok=True)
+    suffix = os.path.splitext(output_file)[1]
+    part_files = [os.path.join(parts_dir, f"part-{idx:04d}{suffix}") for idx in range(len(input_files))]
+
+    print(f"Converting {len(input_files)} reports with {workers} workers")
+    try:
+        tasks = [
+            (input_file, run_conditions, part_file, decoy_pattern, qvalue_threshold, worker_memory_mb, decoy_fraction,
+             run_samples)
+            for input_file, part_file in zip(input_files, part_files)
+        ]
+        with process_pool(workers) as pool:
+            converted = list(pool.map(_convert_diann_part, tasks))
+
+        # Reports without mapped precursors still leave a header-only part
+        part_files = [part_file for part_file, (rows, _) in zip(part_files, converted) if rows > 0]
+        if not part_files:
+            raise RuntimeError("DIA-NN conversion failed: no precursors left after mapping runs to conditions")
+        merge_triqler_inputs(part_files, output_file)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    return set().union(*(conditions for _, conditions in converted))
+
+
+def read_maxquant_evidence(input_file: str) -> Optional[pa.Table]:
+    """Reads the columns needed from a MaxQuant evidence.txt with the multithreaded pyarrow CSV reader.
+
+    Columns are parsed with an explicit schema instead of inferring types, and the repetitive
+    'Raw file', 'Proteins' and 'Modified sequence' columns are dictionary-encoded. Returns
+    None if the file lacks a required column.
+    """
+    header = read_tsv_header(input_file)
+    if any(c not in header for c in MAXQUANT_COLUMN_TYPES):
+        return None
+    columns = list(MAXQUANT_COLUMN_TYPES) + [c for c in MAXQUANT_OPTIONAL_COLUMN_TYPES if c in header]
+    column_types = {**MAXQUANT_COLUMN_TYPES, **MAXQUANT_OPTIONAL_COLUMN_TYPES}
+    with open_input_stream(input_file) as f:
+        return pacsv.read_csv(
+            f,
+            read_options=pacsv.ReadOptions(use_threads=True, block_size=MAXQUANT_BLOCK_SIZE),
+            parse_options=pacsv.ParseOptions(delimiter="\t"),
+            convert_options=pacsv.ConvertOptions(
+                include_columns=columns,
+                column_types={c: column_types[c] for c in columns},
+            ),
+        )
+
+
+def maxquant_to_triqler_frame(
+    evidence: pa.Table,
+    run_conditions: Dict[str, str],
+    decoy_pattern: str,
+    run_samples: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    """Maps MaxQuant evidence rows onto the Triqler input columns.
+
+    The Andromeda score is the search score and rows without a score or intensity (e.g.
+    match-between-runs transfers) are dropped. Proteins of reverse hits get each prefixed
+    with the decoy pattern unless they already carry it. With run_samples, raw files are
+    renamed to their sample (see read_run_samples).
+    """
+    keep = pc.and_(
+        pc.is_valid(evidence.column("Score")),
+        pc.greater(pc.fill_null(evidence.column("Intensity"), 0.0), 0.0),
+    )
+    evidence = evidence.filter(keep)
+    evidence = evidence.filter(pc.is_in(evidence.column("Raw file").cast(pa.string()),
+                                        value_set=pa.array(list(run_conditions.keys()))))
+    report = evidence.to_pandas()
+
+    runs = report["Raw file"].astype(str)
+    proteins = report["Proteins"].astype(str)
+    if "Reverse" in report.columns:
+        is_decoy = (report["Reverse"] == "+") & ~proteins.str.startswith(decoy_pattern)
+        decoy_proteins = decoy_pattern + proteins.str.replace(";", ";" + decoy_pattern, regex=False)
+        proteins = proteins.where(~is_decoy, decoy_proteins)
+
+    return pd.DataFrame({
+        "run": runs.map(run_samples) if run_samples else runs,
+        "condition": runs.map(run_conditions),
+        "charge": report["Charge"],
+        "searchScore": report["Score"],
+        "intensity": report["Intensity"],
+        "peptide": report["Modified sequence"].astype(str),
+        "proteins": proteins,
+    }, columns=TRIQLER_COLUMNS)
+
+
+def convert_maxquant_with_triqler(
     input_file: str,
     file_list_file: str,
     output_file: str,
 ) -> None:
-    """Convert MaxQuant evidence.txt to triqler input format."""
+    """Convert MaxQuant evidence.txt to triqler input format with Triqler's own converter."""
     cmd = [
         sys.executable, "-m", "triqler.convert.maxquant",
         input_file,
@@ -56,26 +637,483 @@ def convert_maxquant_to_triqler(
         raise RuntimeError(f"MaxQuant conversion failed: {result.stderr}")
 
 
-def export_condition_mapping(triqler_input_file: str, output_dir: str) -> None:
-    """Reads Triqler input, extracts conditions, sorts them alphabetically, and writes a mapping file."""
-    conditions = set()
+def convert_maxquant_to_triqler(
+    input_file: str,
+    file_list_file: str,
+    output_file: str,
+    decoy_pattern: str,
+    decoy_fraction: float = 1.0,
+) -> Optional[set]:
+    """Convert MaxQuant evidence.txt to triqler input format and return the conditions written.
+
+    decoy_fraction subsamples the decoy proteins as for DIA-NN. Evidence files without
+    the expected columns fall back to Triqler's converter, which only writes TSV, keeps
+    every decoy and returns no conditions.
+    """
+    evidence = read_maxquant_evidence(input_file)
+    if evidence is None:
+        if output_file.endswith(ARROW_INPUT_SUFFIX):
+            raise RuntimeError(f"MaxQuant evidence file lacks the columns {list(MAXQUANT_COLUMN_TYPES)} "
+                               "needed for the arrow intermediate")
+        if detect_compression(input_file):
+            raise RuntimeError("MaxQuant evidence file lacks the expected columns and Triqler's own converter "
+                               "cannot read compressed files")
+        print("Warning: Evidence file lacks expected columns, using Triqler's MaxQuant converter.",
+              file=sys.stderr)
+        if not detect_compression(file_list_file):
+            convert_maxquant_with_triqler(input_file, file_list_file, output_file)
+            return None
+        # Triqler's converter reads the run mapping by path as plain text too
+        plain_file_list = output_file + ".file_list.tsv"
+        try:
+            with open_input_stream(file_list_file) as f_in, open(plain_file_list, "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            convert_maxquant_with_triqler(input_file, plain_file_list, output_file)
+        finally:
+            if os.path.exists(plain_file_list):
+                os.remove(plain_file_list)
+        return None
+
+    print(f"Converting MaxQuant format: {input_file}")
+    run_conditions = read_file_list(file_list_file)
+    warn_unmapped_runs(pc.unique(evidence.column("Raw file").cast(pa.string())).to_pylist(), run_conditions)
+    frame = maxquant_to_triqler_frame(evidence, run_conditions, decoy_pattern, read_run_samples(file_list_file))
+    frame = subsample_decoys(frame, decoy_pattern, decoy_fraction)
+    if frame.empty:
+        raise RuntimeError("MaxQuant conversion failed: no evidence rows left after mapping runs to conditions")
+    with TriqlerInputWriter(output_file) as writer:
+        writer.write(frame)
+    print(f"Converted {len(frame)} evidence rows from {frame['run'].nunique()} runs")
+    # Only the conditions are returned, so the frame is freed before Triqler runs in-process
+    return set(frame["condition"].unique())
+
+
+_file_digests: Dict[tuple, str] = {}
+
+
+def file_digest(path: str) -> str:
+    """Returns the SHA-256 hex digest of a file's contents, memoized per path, size and mtime."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if key not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(4 * 1024 * 1024), b""):
+                digest.update(block)
+        _file_digests[key] = digest.hexdigest()
+    return _file_digests[key]
+
+
+def conversion_cache_key(input_files: List[str], file_list_file: str, input_format: str, params: Dict) -> str:
+    """Builds the cache key of a conversion from its inputs, format, converter version and parameters."""
     try:
-        with open(triqler_input_file, 'r') as f:
-            header = f.readline().strip().split('\t')
-            # Determine condition column index
-            try:
-                # Try to find 'condition' column by name (case-insensitive)
-                cond_idx = next(i for i, col in enumerate(header) if col.lower() == 'condition')
-            except StopIteration:
-                # Fallback to index 1 (standard Triqler format: run, condition, ...)
-                cond_idx = 1
-            
+        triqler_version = metadata.version("triqler")
+    except metadata.PackageNotFoundError:
+        triqler_version = "unknown"
+    key = {
+        "input_files": [file_digest(path) for path in input_files],
+        "file_list_file": file_digest(file_list_file),
+        "input_format": input_format,
+        "converter_version": CONVERTER_VERSION,
+        "triqler_version": triqler_version,
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    """Places src at dst as a hardlink, falling back to a reflink and then to a plain copy."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        with open(src, "rb") as f_src, open(dst, "wb") as f_dst:
+            fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+        return
+    except OSError:
+        pass
+    shutil.copyfile(src, dst)
+
+
+def touch_cache_entry(entry: str) -> None:
+    """Marks a cache entry as used now, for LRU eviction.
+
+    The entry itself is hardlinked into the output directories of the runs that used it,
+    so its own modification time, part of their run manifest fingerprints, is left alone
+    and the time of use is kept on a separate empty '.used' file instead.
+    """
+    with open(entry + CONVERSION_CACHE_USED_SUFFIX, "a"):
+        pass
+    os.utime(entry + CONVERSION_CACHE_USED_SUFFIX)
+
+
+def fetch_cached_conversion(cache_dir: str, key: str, output_file: str) -> bool:
+    """Links a cached conversion into place. Returns False on a cache miss."""
+    entry = os.path.join(cache_dir, key + os.path.splitext(output_file)[1])
+    if not os.path.exists(entry):
+        return False
+    touch_cache_entry(entry)
+    link_or_copy(entry, output_file)
+    return True
+
+
+def evict_conversion_cache(cache_dir: str, max_bytes: int) -> None:
+    """Removes the least recently used cache entries until the cache fits in max_bytes."""
+    entries = []
+    for path in glob.glob(os.path.join(cache_dir, "*")):
+        if path.endswith(".tmp"):
+            continue
+        if path.endswith(CONVERSION_CACHE_USED_SUFFIX):
+            if not os.path.exists(path[:-len(CONVERSION_CACHE_USED_SUFFIX)]):
+                # Left behind by an entry removed outside of eviction
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        try:
+            used = os.stat(path + CONVERSION_CACHE_USED_SUFFIX).st_mtime
+        except OSError:
+            used = st.st_mtime
+        entries.append((used, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            print(f"Evicted cached conversion: {path}")
+        except OSError:
+            continue
+        try:
+            os.remove(path + CONVERSION_CACHE_USED_SUFFIX)
+        except OSError:
+            pass
+
+
+def store_cached_conversion(cache_dir: str, key: str, output_file: str, max_bytes: int) -> None:
+    """Adds a converted file to the cache and evicts old entries beyond the size limit."""
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, key + os.path.splitext(output_file)[1])
+    temp_entry = f"{entry}.{os.getpid()}.tmp"
+    link_or_copy(output_file, temp_entry)
+    os.replace(temp_entry, entry)
+    touch_cache_entry(entry)
+    evict_conversion_cache(cache_dir, max_bytes)
+
+
+def resolve_input_files(input_file: str) -> List[str]:
+    """Expands a comma-separated list of paths and glob patterns into input files, in order.
+
+    An existing file is taken as is, even if its name contains commas or glob characters.
+    """
+    if os.path.isfile(input_file):
+        return [input_file]
+    input_files = []
+    for pattern in (p.strip() for p in input_file.split(",")):
+        if not pattern:
+            continue
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                raise click.UsageError(f"No input files match {pattern}")
+            input_files.extend(matches)
+        else:
+            input_files.append(pattern)
+    if not input_files:
+        raise click.UsageError("No input file given")
+    return input_files
+
+
+def cgroup_files(name: str, controller: Optional[str] = None) -> List[str]:
+    """Returns the cgroup files called name from this process's cgroup up to the hierarchy root.
+
+    controller selects a cgroup v1 hierarchy; None selects the unified cgroup v2 hierarchy.
+    """
+    try:
+        with open("/proc/self/cgroup", "r") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    cgroup_path = None
+    for line in lines:
+        _, controllers, path = line.split(":", 2)
+        if (controllers == "") if controller is None else (controller in controllers.split(",")):
+            cgroup_path = path
+    if cgroup_path is None:
+        return []
+
+    root = CGROUP_ROOT if controller is None else os.path.join(CGROUP_ROOT, controller)
+    files = []
+    while True:
+        # Inside a cgroup namespace the host path is not mounted; only the root exists
+        candidate = os.path.join(root, cgroup_path.lstrip("/"), name)
+        if os.path.isfile(candidate):
+            files.append(candidate)
+        if cgroup_path in ("", "/"):
+            return files
+        cgroup_path = os.path.dirname(cgroup_path)
+
+
+def read_cgroup_file(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """Returns the CPU quota in cores from cgroup v2 cpu.max or v1 CFS settings, None if unlimited."""
+    limits = []
+    if os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers")):
+        for path in cgroup_files("cpu.max"):
+            quota, _, period = (read_cgroup_file(path) or "max").partition(" ")
+            if quota != "max" and period:
+                limits.append(int(quota) / int(period))
+    else:
+        for path in cgroup_files("cpu.cfs_quota_us", "cpu"):
+            quota = int(read_cgroup_file(path) or -1)
+            period = int(read_cgroup_file(os.path.join(os.path.dirname(path), "cpu.cfs_period_us")) or 0)
+            if quota > 0 and period > 0:
+                limits.append(quota / period)
+    return min(limits) if limits else None
+
+
+def cgroup_memory_limit() -> Optional[tuple]:
+    """Returns (limit, headroom) in bytes for the tightest cgroup memory limit, None if unlimited."""
+    if os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers")):
+        limit_files, controller, usage_name = cgroup_files("memory.max"), None, "memory.current"
+    else:
+        limit_files, controller, usage_name = cgroup_files("memory.limit_in_bytes", "memory"), "memory", "memory.usage_in_bytes"
+    tightest = None
+    for path in limit_files:
+        value = read_cgroup_file(path)
+        if not value or value == "max" or int(value) >= CGROUP_V1_UNLIMITED:
+            continue
+        limit = int(value)
+        usage = int(read_cgroup_file(os.path.join(os.path.dirname(path), usage_name)) or 0)
+        if tightest is None or limit - usage < tightest[1]:
+            tightest = (limit, max(0, limit - usage))
+    return tightest
+
+
+def system_available_memory() -> Optional[int]:
+    """Returns MemAvailable from /proc/meminfo in bytes."""
+    try:
+        with open("/proc/meminfo", "r") as f:
             for line in f:
-                parts = line.strip().split('\t')
-                if len(parts) > cond_idx:
-                    conditions.add(parts[cond_idx])
-        
-        sorted_conditions = sorted(list(conditions))
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def plan_worker_count(num_threads: int, input_size: int = 0) -> Dict:
+    """Decides how many workers to use for num_threads (0 = all usable cores) and records why.
+
+    Usable cores are the CPU affinity mask capped by a cgroup CPU quota. The count is further
+    capped so the estimated Triqler memory for an input of input_size bytes fits in the memory
+    available to the cgroup (or the machine). An explicit num_threads is kept as requested,
+    with a warning if it exceeds either bound.
+    """
+    cpu_count = os.cpu_count() or 1
+    try:
+        affinity = len(os.sched_getaffinity(0))
+    except AttributeError:
+        affinity = cpu_count
+    cpu_quota = cgroup_cpu_limit()
+    cpu_workers = affinity if cpu_quota is None else max(1, min(affinity, int(cpu_quota)))
+
+    memory_limit = cgroup_memory_limit()
+    available_memory = system_available_memory()
+    if memory_limit is not None:
+        available_memory = memory_limit[1] if available_memory is None else min(available_memory, memory_limit[1])
+    worker_memory = TRIQLER_WORKER_BASE_BYTES + TRIQLER_WORKER_MEMORY_FACTOR * input_size
+    main_memory = TRIQLER_MAIN_MEMORY_FACTOR * input_size
+    memory_workers = None
+    if available_memory is not None:
+        memory_workers = max(1, (available_memory - main_memory) // worker_memory)
+
+    if num_threads > 0:
+        workers, limited_by = num_threads, "requested"
+        if num_threads > cpu_workers or (memory_workers is not None and num_threads > memory_workers):
+            print(
+                f"Warning: {num_threads} threads requested, but only {cpu_workers} cores and memory for "
+                f"{memory_workers if memory_workers is not None else 'any number of'} workers are available",
+                file=sys.stderr,
+            )
+    elif memory_workers is not None and memory_workers < cpu_workers:
+        workers, limited_by = memory_workers, "memory"
+    else:
+        workers = cpu_workers
+        limited_by = "cgroup_cpu_quota" if cpu_quota is not None and cpu_workers < affinity else (
+            "cpu_affinity" if affinity < cpu_count else "cpu_count"
+        )
+
+    return {
+        "workers": workers,
+        "limited_by": limited_by,
+        "requested": num_threads,
+        "cpu_count": cpu_count,
+        "cpu_affinity": affinity,
+        "cgroup_cpu_quota": cpu_quota,
+        "cgroup_memory_limit_bytes": memory_limit[0] if memory_limit is not None else None,
+        "available_memory_bytes": available_memory,
+        "input_bytes": input_size,
+        "estimated_worker_bytes": worker_memory,
+        "estimated_main_bytes": main_memory,
+    }
+
+
+def iter_tsv_field(path: str, index: int, to_end_of_line: bool = False) -> Iterator[pa.Array]:
+    """Yields one field of every data line of a possibly compressed TSV, batch by batch, as binary.
+
+    Lines are read whole by the pyarrow CSV reader and split with Arrow compute kernels, which
+    tolerates ragged rows. With to_end_of_line the field runs to the end of the line, tabs
+    included. Lines with fewer fields are skipped.
+    """
+    with open_input_stream(path) as f:
+        # A delimiter that never occurs in the file makes every line a single binary field
+        reader = pacsv.open_csv(
+            f,
+            read_options=pacsv.ReadOptions(
+                column_names=["line"], skip_rows=1, block_size=CONDITION_SCAN_BLOCK_SIZE,
+            ),
+            parse_options=pacsv.ParseOptions(delimiter="\x1f", quote_char=False, escape_char=False),
+            convert_options=pacsv.ConvertOptions(column_types={"line": pa.binary()}),
+        )
+        for batch in reader:
+            fields = pc.split_pattern(batch.column(0), b"\t", max_splits=index if to_end_of_line else index + 1)
+            fields = fields.filter(pc.greater(pc.list_value_length(fields), index))
+            yield pc.list_element(fields, index)
+
+
+def read_input_conditions(triqler_input_file: str) -> set:
+    """Reads the distinct condition values from a Triqler input file or Arrow intermediate.
+
+    Text inputs are read as whole lines by the pyarrow CSV reader and the condition field is
+    split out and deduplicated with Arrow compute kernels, batch by batch.
+    """
+    if triqler_input_file.endswith(ARROW_INPUT_SUFFIX):
+        table = read_triqler_arrow(triqler_input_file, ["condition"])
+        return set(pc.unique(table.column("condition").cast(pa.string())).to_pylist())
+
+    header = [col.strip() for col in read_tsv_header(triqler_input_file)]
+    # Determine condition column index
+    try:
+        # Try to find 'condition' column by name (case-insensitive)
+        cond_idx = next(i for i, col in enumerate(header) if col.lower() == 'condition')
+    except StopIteration:
+        # Fallback to index 1 (standard Triqler format: run, condition, ...)
+        cond_idx = 1
+
+    conditions = set()
+    for field in iter_tsv_field(triqler_input_file, cond_idx):
+        conditions.update(pc.unique(field).to_pylist())
+    return {c.decode("utf-8") for c in conditions}
+
+
+def read_input_accessions(triqler_input_file: str, decoy_pattern: str) -> set:
+    """Collects the normalized target accessions named in the proteins field(s) of a Triqler input.
+
+    Everything from the proteins column to the end of a line is taken, as Triqler allows
+    extra protein columns.
+    """
+    if triqler_input_file.endswith(ARROW_INPUT_SUFFIX):
+        table = read_triqler_arrow(triqler_input_file, ["proteins"])
+        values = pc.unique(table.column("proteins").cast(pa.string()))
+        return set(map_accessions(values, decoy_pattern, r"[\t;]").values())
+
+    header = [col.strip().lower() for col in read_tsv_header(triqler_input_file)]
+    prot_idx = header.index("proteins") if "proteins" in header else len(TRIQLER_COLUMNS) - 1
+    accessions = set()
+    for field in iter_tsv_field(triqler_input_file, prot_idx, to_end_of_line=True):
+        values = pc.unique(field).cast(pa.string())
+        accessions.update(map_accessions(values, decoy_pattern, r"[\t;]").values())
+    return accessions
+
+
+def start_gene_prefetch(
+    triqler_input_file: str,
+    decoy_pattern: str,
+    gene_lookup: Callable[[Iterable[str]], Optional[Dict[str, str]]],
+) -> Future:
+    """Resolves gene names for every accession in the Triqler input on a background thread.
+
+    The future's result is the (requested accessions, gene names) pair. The accessions are
+    read up front: a daemon thread still inside pyarrow's threaded CSV reader can hang
+    interpreter shutdown. Only the lookup runs on the daemon thread, so a failed Triqler
+    run can exit without waiting on UniProt.
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+    try:
+        accessions = read_input_accessions(triqler_input_file, decoy_pattern)
+    except Exception as e:
+        future.set_exception(e)
+        return future
+
+    def prefetch() -> None:
+        try:
+            future.set_result((accessions, gene_lookup(accessions) if accessions else {}))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=prefetch, name="gene-prefetch", daemon=True).start()
+    return future
+
+
+def prefetched_gene_names(
+    clean_accessions: Iterable[str],
+    prefetch: Future,
+    gene_lookup: Callable[[Iterable[str]], Optional[Dict[str, str]]],
+) -> Optional[Dict[str, str]]:
+    """Joins accessions against the prefetched gene names, looking up only what the prefetch missed."""
+    clean_accessions = set(clean_accessions)
+    try:
+        requested, gene_names = prefetch.result()
+    except Exception as e:
+        print(f"Warning: Gene name prefetch failed: {e}", file=sys.stderr)
+        return gene_lookup(clean_accessions)
+
+    if gene_names is None:
+        # The lookup already failed and warned; retrying would only repeat the wait
+        return None
+    misses = clean_accessions - requested
+    if not misses:
+        return gene_names
+    more = gene_lookup(misses)
+    if more is None:
+        return gene_names
+    return {**gene_names, **more}
+
+
+def export_condition_mapping(
+    triqler_input_file: str,
+    output_dir: str,
+    conditions: Optional[Iterable[str]] = None,
+) -> None:
+    """Sorts the input conditions alphabetically and writes a mapping file.
+
+    Conditions are read from the Triqler input unless they are passed in, e.g. as collected
+    while the in-process conversion wrote it.
+    """
+    try:
+        if conditions is None:
+            conditions = read_input_conditions(triqler_input_file)
+
+        sorted_conditions = sorted(set(conditions))
         
         map_file = os.path.join(output_dir, "condition_mapping.tsv")
         with open(map_file, 'w') as f:
@@ -92,145 +1130,1207 @@ def export_condition_mapping(triqler_input_file: str, output_dir: str) -> None:
         print(f"Warning: Could not extract condition mapping: {e}", file=sys.stderr)
 
 
-def cleanup_protein_files(output_dir: str) -> None:
-    """Consolidates extra peptide columns into a single semicolon-separated 'peptides' column."""
-    protein_files = glob.glob(os.path.join(output_dir, "proteins*.tsv"))
-    for file_path in protein_files:
+def normalize_accessions(accessions: pa.Array) -> pa.Array:
+    """Normalizes protein identifiers in bulk to the bare accession used for gene lookups.
+
+    'db|ACC|NAME' FASTA-style identifiers are reduced to ACC, UniProt isoform suffixes
+    (P12345-2) and RefSeq/Ensembl version suffixes (NP_000537.3, ENSP00000269305.4) are
+    removed, and surrounding whitespace is trimmed.
+    """
+    accessions = pc.utf8_trim_whitespace(accessions.cast(pa.string()))
+    # The second '|'-field of 'ID|ID' is the field after the first '|' when there is one, and the
+    # whole ID otherwise, which avoids a regex pass over the mostly '|'-delimited input
+    doubled = pc.binary_join_element_wise(accessions, accessions, "|")
+    accessions = pc.list_element(pc.split_pattern(doubled, "|", max_splits=2), 1)
+    accessions = pc.replace_substring_regex(accessions, UNIPROT_ISOFORM_PATTERN, r"\1")
+    return pc.replace_substring_regex(accessions, ACCESSION_VERSION_PATTERN, r"\1")
+
+
+def map_accessions(proteins: pa.Array, decoy_pattern: str, separator: str = ";") -> Dict[str, str]:
+    """Splits protein group entries into accessions and maps each target accession to its normalized form."""
+    raw = pc.unique(pc.list_flatten(pc.split_pattern_regex(proteins.cast(pa.string()), separator)))
+    raw = raw.filter(pc.and_(pc.not_equal(raw, ""), pc.invert(pc.starts_with(raw, decoy_pattern))))
+    return dict(zip(raw.to_pylist(), normalize_accessions(raw).to_pylist()))
+
+
+def collect_protein_accessions(file_path: str, decoy_pattern: str) -> Dict[str, str]:
+    """Scans the 'protein' column of one results file and maps each target accession to its normalized form."""
+    header = read_tsv_header(file_path)
+    if "protein" not in header:
+        return {}
+    prot_idx = header.index("protein")
+    raw_to_clean = {}
+    for field in iter_tsv_field(file_path, prot_idx):
+        raw_to_clean.update(map_accessions(pc.unique(field), decoy_pattern))
+    return raw_to_clean
+
+
+def _collect_protein_accessions_part(args: tuple) -> tuple:
+    """Process pool worker for collect_protein_accessions. Returns (accessions, error message)."""
+    file_path, decoy_pattern = args
+    try:
+        return collect_protein_accessions(file_path, decoy_pattern), None
+    except Exception as e:
+        return {}, str(e)
+
+
+class UniProtClient:
+    """Fetches primary gene names from the UniProt REST API.
+
+    Each thread keeps its own persistent HTTP connection, so a thread pool sharing one
+    client reuses a connection per worker. Rate limiting (429), server errors and
+    connection failures are retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, base_url: str = UNIPROT_URL, retries: int = 3, backoff: float = 1.0, timeout: float = 60.0):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Invalid UniProt URL: {base_url}")
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.connection_class(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+    def gene_names(self, accessions: List[str]) -> Dict[str, str]:
+        """Maps each accession of one batch to its primary gene name ('' if it has none)."""
+        query = urlencode({
+            "accessions": ",".join(accessions),
+            "fields": "accession,sec_acc,gene_primary",
+            "format": "tsv",
+            "size": len(accessions),
+        })
+        error = ""
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * 2 ** attempt
+            conn = self._connection()
+            try:
+                conn.request("GET", f"{self.path}/uniprotkb/accessions?{query}")
+                response = conn.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                # Drop the broken socket; the next request reconnects
+                conn.close()
+                error = str(e) or type(e).__name__
+            else:
+                if response.status == 200:
+                    return self._parse_gene_names(body, accessions)
+                error = f"HTTP {response.status} {response.reason}"
+                if response.status != 429 and response.status < 500:
+                    raise RuntimeError(error)
+                retry_after = response.getheader("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            if attempt < self.retries:
+                time.sleep(delay * random.uniform(0.5, 1.0))
+        raise RuntimeError(f"{error} after {self.retries + 1} attempts")
+
+    @staticmethod
+    def _parse_gene_names(body: bytes, accessions: List[str]) -> Dict[str, str]:
+        mapping = dict.fromkeys(accessions, "")
+        lines = body.decode("utf-8").splitlines()
+        for line in lines[1:]:
+            fields = line.split("\t")
+            if len(fields) < 3:
+                continue
+            gene = fields[2].split(";")[0].strip()
+            # Entries merged into another one come back under their new accession, which
+            # lists the submitted one among its secondary accessions
+            for acc in [fields[0], *fields[1].split(";")]:
+                acc = acc.strip()
+                if acc in mapping:
+                    mapping[acc] = gene
+        return mapping
+
+
+def fetch_gene_names(
+    clean_accessions: Iterable[str],
+    base_url: str = UNIPROT_URL,
+    batch_size: int = 250,
+    concurrency: int = 4,
+    retries: int = 3,
+) -> Optional[Dict[str, str]]:
+    """Maps accessions to their primary gene name via concurrent batched UniProt requests.
+
+    Accessions looked up without a gene name, and those that are not UniProt accessions
+    at all, map to ''. Accessions of failed batches are left out, so results of the
+    batches that succeeded are kept. Returns None only if every batch failed.
+    """
+    clean_accessions = set(clean_accessions)
+    accessions = sorted(acc for acc in clean_accessions if UNIPROT_ACCESSION_PATTERN.match(acc))
+    mapping = dict.fromkeys(clean_accessions.difference(accessions), "")
+    if not accessions:
+        return mapping
+
+    batch_size = max(1, min(batch_size, UNIPROT_MAX_BATCH_SIZE))
+    batches = [accessions[i:i + batch_size] for i in range(0, len(accessions), batch_size)]
+    print(f"Fetching gene names for {len(accessions)} unique proteins from UniProt in {len(batches)} batches...")
+
+    try:
+        client = UniProtClient(base_url, retries=retries)
+    except ValueError as e:
+        print(f"Warning: UniProt mapping failed: {e}", file=sys.stderr)
+        return None
+
+    failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches)))) as pool:
+            futures = [pool.submit(client.gene_names, batch) for batch in batches]
+            for batch, future in zip(batches, futures):
+                try:
+                    mapping.update(future.result())
+                except Exception as e:
+                    failed += 1
+                    print(f"Warning: UniProt request for {len(batch)} accessions failed: {e}", file=sys.stderr)
+    finally:
+        client.close()
+
+    if failed == len(batches):
+        print("Warning: UniProt mapping failed for every batch.", file=sys.stderr)
+        return None
+    if failed:
+        print(f"Warning: Gene names missing for {failed} of {len(batches)} UniProt batches.", file=sys.stderr)
+    return mapping
+
+
+def fasta_index_stamp(fasta_file: str) -> str:
+    """Returns the first line of a gene index, which ties the index to the FASTA's size and mtime."""
+    st = os.stat(fasta_file)
+    return f"{FASTA_INDEX_MAGIC} {st.st_size} {st.st_mtime_ns}\n"
+
+
+def build_fasta_gene_index(fasta_file: str, index_file: str) -> int:
+    """Writes a sorted accession<TAB>gene index from the GN= (or Ensembl gene_symbol:) fields of a FASTA.
+
+    Accessions are normalized like the results' accessions. Returns the entry count.
+    """
+    stamp = fasta_index_stamp(fasta_file)
+    header_accessions = []
+    header_genes = []
+    with open_text_input(fasta_file) as f:
+        for line in f:
+            if not line.startswith(">"):
+                continue
+            header = line[1:].strip()
+            match = FASTA_GENE_PATTERN.search(header)
+            if header and match:
+                header_accessions.append(header.split(None, 1)[0])
+                header_genes.append(match.group(1))
+
+    genes = {}
+    normalized = normalize_accessions(pa.array(header_accessions, pa.string())).to_pylist()
+    for acc, gene in zip(normalized, header_genes):
+        genes.setdefault(acc, gene)
+
+    temp_file = f"{index_file}.{os.getpid()}.tmp"
+    try:
+        with open(temp_file, "w", encoding="utf-8", newline="\n") as f:
+            f.write(stamp)
+            for acc in sorted(genes):
+                f.write(f"{acc}\t{genes[acc]}\n")
+        os.replace(temp_file, index_file)
+    except BaseException:
+        # Do not leave a half-written index behind, e.g. on a full disk
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    return len(genes)
+
+
+def ensure_fasta_gene_index(fasta_file: str, fallback_dir: str) -> str:
+    """Returns the path of an up-to-date gene index for fasta_file, building it if needed.
+
+    The index is kept next to the FASTA so later runs reuse it; if it cannot be written
+    there (no permission, read-only mount, ...), it is built in fallback_dir instead.
+    """
+    stamp = fasta_index_stamp(fasta_file)
+    candidates = [
+        fasta_file + FASTA_INDEX_SUFFIX,
+        os.path.join(fallback_dir, os.path.basename(fasta_file) + FASTA_INDEX_SUFFIX),
+    ]
+    for index_file in candidates:
         try:
-            temp_file = file_path + ".clean"
-            with open(file_path, "r", encoding="utf-8") as f_in, \
-                 open(temp_file, "w", encoding="utf-8", newline="") as f_out:
-                
-                reader = csv.DictReader(f_in, delimiter="\t")
-                if not reader.fieldnames:
+            with open(index_file, "r", encoding="utf-8") as f:
+                if f.readline() == stamp:
+                    return index_file
+        except (OSError, UnicodeDecodeError):
+            pass
+
+    error = None
+    for index_file in candidates:
+        try:
+            count = build_fasta_gene_index(fasta_file, index_file)
+        except OSError as e:
+            error = e
+            continue
+        print(f"Built gene index with {count} accessions: {index_file}")
+        return index_file
+    raise RuntimeError(f"Could not write a gene index for {fasta_file}: {error}")
+
+
+def lookup_fasta_gene_names(clean_accessions: Iterable[str], index_file: str) -> Dict[str, str]:
+    """Maps accessions to gene names by binary search over the memory-mapped gene index."""
+    mapping = {}
+    with open(index_file, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Entries start after the stamp line, so there is always a newline before any entry
+            data_start = mm.find(b"\n") + 1
+            data_end = len(mm)
+            for acc in clean_accessions:
+                key = acc.encode("utf-8")
+                lo, hi = data_start, data_end
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    line_start = mm.rfind(b"\n", data_start - 1, mid) + 1
+                    line_end = mm.find(b"\n", line_start)
+                    entry, _, gene = mm[line_start:line_end].partition(b"\t")
+                    if entry == key:
+                        mapping[acc] = gene.decode("utf-8")
+                        break
+                    if entry < key:
+                        lo = line_end + 1
+                    else:
+                        hi = line_start
+    return mapping
+
+
+def fasta_gene_names(clean_accessions: Iterable[str], fasta_file: str, fallback_dir: str) -> Optional[Dict[str, str]]:
+    """Maps accessions to gene names from the GN= fields of the search FASTA, without network access."""
+    try:
+        index_file = ensure_fasta_gene_index(fasta_file, fallback_dir)
+    except (OSError, RuntimeError) as e:
+        print(f"Warning: FASTA gene annotation failed: {e}", file=sys.stderr)
+        return None
+    return lookup_fasta_gene_names(clean_accessions, index_file)
+
+
+def open_gene_cache(cache_file: str) -> sqlite3.Connection:
+    """Opens (and creates if needed) the accession to gene name cache database.
+
+    The database runs in WAL mode so concurrent jobs can read while one of them writes;
+    writers serialise on BEGIN IMMEDIATE and wait up to the connection timeout.
+    """
+    cache_parent = os.path.dirname(os.path.abspath(cache_file))
+    os.makedirs(cache_parent, exist_ok=True)
+    conn = sqlite3.connect(cache_file, timeout=60, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS gene_names ("
+        "accession TEXT PRIMARY KEY, gene_name TEXT NOT NULL, fetched REAL NOT NULL, used REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS gene_names_used ON gene_names (used)")
+    return conn
+
+
+def cached_gene_names(
+    clean_accessions: Iterable[str],
+    cache_file: str,
+    ttl_days: float,
+    max_entries: int,
+    fetcher: Callable[[Iterable[str]], Optional[Dict[str, str]]] = fetch_gene_names,
+) -> Optional[Dict[str, str]]:
+    """Maps accessions to gene names, asking fetcher only for accessions missing from the cache.
+
+    Entries older than ttl_days are refetched, but still used if the fetch fails. Accessions
+    the fetcher maps to '' (no gene name) are cached so they are not asked for again, while
+    accessions it leaves out, e.g. from a failed batch, are asked for on the next run.
+    The least recently used entries are evicted once the cache holds more than max_entries.
+    """
+    clean_accessions = list(clean_accessions)
+    try:
+        conn = open_gene_cache(cache_file)
+    except sqlite3.Error as e:
+        print(f"Warning: Gene name cache disabled: {e}", file=sys.stderr)
+        return fetcher(clean_accessions)
+
+    fetch_done = False
+    try:
+        now = time.time()
+        fresh_after = now - ttl_days * 86400
+        cached = {}
+        stale = {}
+        for start in range(0, len(clean_accessions), GENE_CACHE_QUERY_CHUNK):
+            chunk = clean_accessions[start:start + GENE_CACHE_QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT accession, gene_name, fetched FROM gene_names WHERE accession IN ({placeholders})", chunk
+            )
+            for acc, gene, fetched in rows:
+                if fetched >= fresh_after:
+                    cached[acc] = gene
+                else:
+                    stale[acc] = gene
+
+        misses = [acc for acc in clean_accessions if acc not in cached]
+        print(f"Gene name cache: {len(cached)} hits, {len(misses)} to fetch")
+        fetched_names = fetcher(misses) if misses else {}
+        fetch_done = True
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("UPDATE gene_names SET used = ? WHERE accession = ?", ((now, acc) for acc in cached))
+            if fetched_names is not None:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO gene_names (accession, gene_name, fetched, used) VALUES (?, ?, ?, ?)",
+                    ((acc, gene, now, now) for acc, gene in fetched_names.items()),
+                )
+            if max_entries > 0:
+                conn.execute(
+                    "DELETE FROM gene_names WHERE accession IN ("
+                    "SELECT accession FROM gene_names ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                    (max_entries,),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    except sqlite3.Error as e:
+        print(f"Warning: Gene name cache unavailable: {e}", file=sys.stderr)
+        if not fetch_done:
+            return fetcher(clean_accessions)
+        # The lookup itself succeeded, only storing it failed: use what was fetched
+    finally:
+        conn.close()
+
+    if fetched_names is None:
+        if not cached and not stale:
+            return None
+        # Fall back to expired entries rather than dropping annotation altogether
+        fetched_names = stale
+    else:
+        fetched_names = {**stale, **fetched_names}
+    mapping = {acc: gene for acc, gene in cached.items() if gene}
+    mapping.update((acc, gene) for acc, gene in fetched_names.items() if gene)
+    return mapping
+
+
+def join_gene_names(protein: str, gene_names: Dict[str, str], raw_to_clean: Dict[str, str]) -> str:
+    """Returns the gene_name value for a 'protein' entry of semicolon-separated accessions."""
+    genes = []
+    for r_acc in protein.split(";"):
+        g = gene_names.get(raw_to_clean.get(r_acc, r_acc), "")
+        if g and g not in genes: # Deduplicate while maintaining some sense of order
+            genes.append(g)
+    return ";".join(genes)
+
+
+def read_protein_rows(f: TextIO) -> Iterator[tuple]:
+    """Yields (fields, plain) for each line of a tab-separated file opened with newline=''.
+
+    Lines without a quote character are split on tabs directly, which is much cheaper than
+    the csv module; plain tells such fields need no quoting when written back with tabs.
+    Lines with quotes, whose fields may hold tabs or line breaks, are parsed by csv.reader;
+    line breaks inside fields become '\n', as if the file had been read in text mode.
+    Blank lines yield an empty list, as with csv.reader.
+    """
+    lines = iter(f)
+    for line in lines:
+        if '"' in line:
+            # A fresh reader per record pulls continuation lines of a quoted field from lines
+            row = next(csv.reader(itertools.chain([line], lines), delimiter="\t"), [])
+            yield [field.replace("\r\n", "\n").replace("\r", "\n") for field in row], False
+        else:
+            content = line.rstrip("\r\n")
+            yield (content.split("\t") if content else []), True
+
+
+def has_ragged_protein_rows(file_path: str, num_cols: int) -> bool:
+    """Returns whether any data row of a protein file has more or fewer fields than its header."""
+    with open(file_path, "r", encoding="utf-8", newline="") as f:
+        rows = read_protein_rows(f)
+        next(rows, None)
+        return any(row and len(row) != num_cols for row, _ in rows)
+
+
+def postprocess_protein_file(
+    file_path: str,
+    gene_names: Optional[Dict[str, str]],
+    raw_to_clean: Dict[str, str],
+    output_file: Optional[str] = None,
+) -> bool:
+    """Rewrites one Triqler protein file in a single pass. Returns whether it was rewritten.
+
+    Extra peptide columns are consolidated into a single semicolon-separated 'peptides'
+    column and, if gene names are given, a 'gene_name' column is inserted after 'protein'
+    unless the file already has one. The file is replaced in place, or the result is
+    written to output_file if given. A file that needs neither change is left alone and
+    nothing is written.
+    """
+    temp_file = output_file or file_path + ".tmp"
+    with open(file_path, "r", encoding="utf-8", newline="") as f_in:
+        reader = read_protein_rows(f_in)
+        header, _ = next(reader, ([], True))
+        if not header:
+            return False
+        num_cols = len(header)
+        pep_idx = header.index("peptides") if "peptides" in header else None
+        prot_idx = None
+        if gene_names is not None and "protein" in header and "gene_name" not in header:
+            prot_idx = header.index("protein")
+        elif not has_ragged_protein_rows(file_path, num_cols):
+            # A read-only scan is much cheaper than rewriting an unchanged file, e.g. in sidecar mode
+            return False
+
+        with open(temp_file, "w", encoding="utf-8", newline="") as f_out:
+            writer = csv.writer(f_out, delimiter="\t")
+            if prot_idx is None:
+                writer.writerow(header)
+            else:
+                writer.writerow(header[:prot_idx + 1] + ["gene_name"] + header[prot_idx + 1:])
+
+            for row, plain in reader:
+                if not row:
                     continue
-                
-                writer = csv.DictWriter(f_out, fieldnames=reader.fieldnames, delimiter="\t", extrasaction='ignore')
-                writer.writeheader()
-                
-                for row in reader:
-                    # Collect extra columns from the None key
-                    extras = row.get(None, [])
-                    if extras and "peptides" in row:
+                if len(row) > num_cols:
+                    # Peptides spilling into extra columns
+                    extras = row[num_cols:]
+                    row = row[:num_cols]
+                    if pep_idx is not None:
                         # Filter out empty or whitespace-only strings
                         clean_extras = [x.strip() for x in extras if x and x.strip()]
                         if clean_extras:
-                            # Append to existing peptides
-                            row["peptides"] = row["peptides"] + ";" + ";".join(clean_extras)
-                    
+                            row[pep_idx] = row[pep_idx] + ";" + ";".join(clean_extras)
+                elif len(row) < num_cols:
+                    row.extend([""] * (num_cols - len(row)))
+
+                if prot_idx is not None:
+                    genes = join_gene_names(row[prot_idx], gene_names, raw_to_clean)
+                    plain = plain and not CSV_QUOTED_CHARACTERS.search(genes)
+                    row.insert(prot_idx + 1, genes)
+
+                # csv.writer quotes a lone empty field; any other plain row is written as is
+                if plain and (len(row) > 1 or row[0]):
+                    f_out.write("\t".join(row) + "\r\n")
+                else:
                     writer.writerow(row)
-            
-            os.replace(temp_file, file_path)
-        except Exception as e:
-            print(f"Warning: Failed to cleanup malformed columns in {file_path}: {e}", file=sys.stderr)
+
+    if output_file is None:
+        os.replace(temp_file, file_path)
+    return True
 
 
-def add_gene_names(output_dir: str, decoy_pattern: str) -> None:
-    """Adds a gene name column to all protein results files in the output directory using uniprotparser."""
+def _postprocess_protein_file_part(args: tuple) -> tuple:
+    """Process pool worker for postprocess_protein_file. Returns (rewritten, error message on failure)."""
+    file_path, gene_names, raw_to_clean, output_file = args
     try:
-        from uniprotparser.betaparser import UniprotParser
-    except ImportError:
-        print("Warning: uniprotparser not installed. Skipping gene name annotation.", file=sys.stderr)
-        return
+        return postprocess_protein_file(file_path, gene_names, raw_to_clean, output_file), None
+    except Exception as e:
+        return False, str(e)
+
 
-    protein_files = glob.glob(os.path.join(output_dir, "proteins*.tsv"))
+def map_protein_files(worker, tasks: List[tuple], workers: int) -> list:
+    """Runs worker over tasks, in a process pool when there is more than one worker and task."""
+    workers = min(workers, len(tasks))
+    if workers <= 1:
+        return [worker(task) for task in tasks]
+    with process_pool(workers) as pool:
+        return list(pool.map(worker, tasks))
+
+
+def postprocess_protein_files(
+    output_dir: str,
+    decoy_pattern: str,
+    workers: int = 1,
+    gene_lookup: Callable[[Iterable[str]], Optional[Dict[str, str]]] = fetch_gene_names,
+    gene_annotation: str = "inline",
+    before_replace: Optional[Callable[[Dict[str, str], bool], None]] = None,
+) -> None:
+    """Cleans up and annotates all protein results files with one rewrite per file.
+
+    Only the 'protein' column is scanned up front to collect accessions; ragged peptide
+    columns are then fixed and gene names inserted while each file is rewritten. Both
+    passes run over the per-comparison files in a pool of up to workers processes, and
+    failures are reported per file in sorted file order. gene_lookup maps the clean
+    accessions to gene names. With gene_annotation 'sidecar' the gene names are written
+    once to gene_annotations.tsv instead, to be joined by read_protein_results.
+
+    Files that need no change are not rewritten. All others are rewritten to temporary
+    files before any is replaced. before_replace, if given, is called in between with the
+    {file: rewritten temporary file} mapping and whether every file succeeded, which also
+    requires the gene lookup to have succeeded if there were accessions to look up.
+    """
+    protein_files = sorted(glob.glob(os.path.join(output_dir, "proteins*.tsv")))
     if not protein_files:
         return
 
-    def get_clean_acc(acc: str) -> str:
-        """Extracts the bare accession from strings like 'sp|P12345|NAME'."""
-        if "|" in acc:
-            parts = acc.split("|")
-            if len(parts) > 1:
-                return parts[1]
-        return acc
+    scanned = map_protein_files(
+        _collect_protein_accessions_part, [(file_path, decoy_pattern) for file_path in protein_files], workers
+    )
+    file_accessions = []
+    for file_path, (accessions, error) in zip(protein_files, scanned):
+        if error is not None:
+            print(f"Warning: Could not read {file_path} for accession extraction: {error}", file=sys.stderr)
+        file_accessions.append(accessions)
 
     raw_to_clean = {}
-    clean_accessions = set()
-    
-    for file_path in protein_files:
+    for accessions in file_accessions:
+        raw_to_clean.update(accessions)
+    gene_names = gene_lookup(set(raw_to_clean.values())) if raw_to_clean else None
+
+    annotated = gene_names is not None
+    if gene_annotation == "sidecar":
+        annotations_file = os.path.join(output_dir, GENE_ANNOTATIONS_FILE)
+        if annotated:
+            write_gene_annotations(annotations_file, raw_to_clean, gene_names)
+        elif os.path.exists(annotations_file):
+            os.remove(annotations_file)
+        # The protein files then only get their peptide columns consolidated
+        gene_names = None
+
+    # Only ship each worker the slice of the mappings its own file needs
+    tasks = []
+    for file_path, accessions in zip(protein_files, file_accessions):
+        file_genes = None
+        if gene_names is not None:
+            file_genes = {clean: gene_names[clean] for clean in set(accessions.values()) if clean in gene_names}
+        tasks.append((file_path, file_genes, accessions, file_path + ".tmp"))
+
+    results = map_protein_files(_postprocess_protein_file_part, tasks, workers)
+    errors = [error for _, error in results]
+    rewritten = {}
+    for file_path, (was_rewritten, error) in zip(protein_files, results):
+        if error is not None:
+            print(f"Warning: Failed to post-process {file_path}: {error}", file=sys.stderr)
+        elif was_rewritten:
+            rewritten[file_path] = file_path + ".tmp"
+
+    # Replacing only after every rewrite leaves each file either as Triqler wrote it or fully
+    # post-processed if the job dies, which is what a resumed run relies on
+    if before_replace is not None:
+        # A failed gene lookup leaves the files unannotated, so a resumed run must try again
+        succeeded = all(error is None for error in errors) and (annotated or not raw_to_clean)
+        before_replace(rewritten, succeeded)
+    for file_path, temp_file in rewritten.items():
+        os.replace(temp_file, file_path)
+
+    if annotated:
+        print("Gene name annotation complete.")
+
+
+def write_gene_annotations(annotations_file: str, raw_to_clean: Dict[str, str], gene_names: Dict[str, str]) -> None:
+    """Writes the accession to gene name sidecar, keyed by accessions as they appear in the results."""
+    temp_file = annotations_file + ".tmp"
+    with open(temp_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(["accession", "gene_name"])
+        for raw_acc in sorted(raw_to_clean):
+            gene = gene_names.get(raw_to_clean[raw_acc], "")
+            if gene:
+                writer.writerow([raw_acc, gene])
+    os.replace(temp_file, annotations_file)
+
+
+def read_protein_results(protein_file: str, annotations_file: Optional[str] = None) -> pd.DataFrame:
+    """Loads a Triqler protein results file, joining gene names from a sidecar if there is one.
+
+    annotations_file defaults to gene_annotations.tsv next to protein_file. Files annotated
+    inline already carry a gene_name column and are returned as read.
+    """
+    results = pd.read_csv(protein_file, sep="\t", dtype={"protein": str, "peptides": str}, keep_default_na=False)
+    if annotations_file is None:
+        annotations_file = os.path.join(os.path.dirname(protein_file), GENE_ANNOTATIONS_FILE)
+    if "gene_name" in results.columns or "protein" not in results.columns or not os.path.exists(annotations_file):
+        return results
+
+    annotations = pd.read_csv(annotations_file, sep="\t", dtype=str, keep_default_na=False)
+    gene_names = dict(zip(annotations["accession"], annotations["gene_name"]))
+    results.insert(
+        results.columns.get_loc("protein") + 1,
+        "gene_name",
+        [join_gene_names(protein, gene_names, {}) for protein in results["protein"]],
+    )
+    return results
+
+
+def parse_fold_change_sweep(fold_change_sweep: Optional[str]) -> List[float]:
+    """Parses a comma-separated list of log2 fold change thresholds, dropping duplicates."""
+    thresholds = []
+    for value in (v.strip() for v in (fold_change_sweep or "").split(",")):
+        if not value:
+            continue
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f, delimiter="\t")
-                if not reader.fieldnames or "protein" not in reader.fieldnames:
-                    continue
-                for row in reader:
-                    for raw_acc in row["protein"].split(";"):
-                        if not raw_acc.startswith(decoy_pattern):
-                            clean = get_clean_acc(raw_acc)
-                            raw_to_clean[raw_acc] = clean
-                            clean_accessions.add(clean)
-        except Exception as e:
-            print(f"Warning: Could not read {file_path} for accession extraction: {e}", file=sys.stderr)
-
-    if not clean_accessions:
-        return
+            threshold = float(value)
+        except ValueError:
+            raise click.UsageError(f"Invalid fold change threshold in --fold_change_sweep: {value}")
+        if threshold < 0:
+            raise click.UsageError(f"Fold change thresholds must not be negative, got {value}")
+        if threshold not in thresholds:
+            thresholds.append(threshold)
+    return thresholds
 
-    print(f"Fetching gene names for {len(clean_accessions)} unique proteins from UniProt...")
-    parser = UniprotParser(columns="accession,gene_names")
-    mapping = {}
-    
+
+def fold_change_sweep_file(output_dir: str, threshold: float) -> str:
+    return os.path.join(output_dir, f"proteins_fc{threshold:g}.tsv")
+
+
+def copy_protein_results(out_file: str, target_file: str) -> None:
+    """Copies a Triqler protein results file, with its per-comparison files, under another name."""
+    out_stem, target_stem = os.path.splitext(out_file)[0], os.path.splitext(target_file)[0]
+    shutil.copyfile(out_file, target_file)
+    for comparison_file in glob.glob(glob.escape(out_stem) + ".*.tsv"):
+        shutil.copyfile(comparison_file, target_stem + comparison_file[len(out_stem):])
+
+
+def read_fold_change_posteriors(posteriors_file: str) -> Optional[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+    """Reads Triqler's fold change posteriors as (log2 fold change grid, {protein: probabilities}).
+
+    Returns None unless the file holds exactly one distribution per protein over a grid given
+    in the header, i.e. a single comparison.
+    """
+    with open(posteriors_file, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f, delimiter="\t")
+        header = next(reader, None)
+        if not header:
+            return None
+        grid_start = None
+        for i in range(1, len(header)):
+            try:
+                grid = np.array(header[i:], dtype=float)
+            except ValueError:
+                continue
+            grid_start = i
+            break
+        if grid_start is None or len(grid) < 2:
+            return None
+
+        posteriors = {}
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != len(header) or row[0] in posteriors:
+                return None
+            try:
+                posteriors[row[0]] = np.array(row[grid_start:], dtype=float)
+            except ValueError:
+                return None
+    return grid, posteriors
+
+
+def posterior_qvalues(peps: np.ndarray, monotone: bool) -> np.ndarray:
+    """Returns q-values as the running mean of sorted posterior error probabilities."""
+    order = np.argsort(peps, kind="stable")
+    qvalues = np.cumsum(peps[order]) / np.arange(1, len(peps) + 1)
+    if monotone:
+        qvalues = np.minimum.accumulate(qvalues[::-1])[::-1]
+    result = np.empty_like(qvalues)
+    result[order] = qvalues
+    return result
+
+
+def write_fold_change_sweep(
+    protein_file: str,
+    posteriors_file: str,
+    thresholds: List[float],
+    output_dir: str,
+) -> bool:
+    """Writes proteins_fc<X>.tsv for each threshold from a single Triqler run's fold change posteriors.
+
+    The differential expression probability at X is the posterior mass with |log2 fold change|
+    above X. The derivation (including how Triqler treats grid points at the threshold and
+    forms q-values) is first checked against Triqler's own diff_exp_prob, posterior_error_prob
+    and q_value columns; returns False without writing anything if it does not reproduce them.
+    """
+    parsed = read_fold_change_posteriors(posteriors_file) if os.path.exists(posteriors_file) else None
+    if parsed is None:
+        return False
+    grid, posteriors = parsed
+
+    with open(protein_file, "r", encoding="utf-8", newline="") as f:
+        rows = [row for row, _ in read_protein_rows(f) if row]
+    if len(rows) < 2:
+        return False
+    header, rows = rows[0], rows[1:]
+    diff_idx = next((i for i, col in enumerate(header) if col.startswith("diff_exp_prob")), None)
+    if diff_idx is None or not {"q_value", "posterior_error_prob", "protein"} <= set(header):
+        return False
+    q_idx, pep_idx, prot_idx = (header.index(col) for col in ("q_value", "posterior_error_prob", "protein"))
     try:
-        for result_chunk in parser.parse(ids=list(clean_accessions), from_key="UniProtKB_AC-ID", to_key="UniProtKB"):
-            f = StringIO(result_chunk)
-            reader = csv.DictReader(f, delimiter="\t")
-            for row in reader:
-                # 'From' is the ID we sent, 'Gene Names' is the UniProt result column
-                acc = row.get("From")
-                gene = row.get("Gene Names", "")
-                if not acc:
-                    acc = row.get("Entry") # Fallback
-                
-                if acc and gene:
-                    # Take primary gene name (first one)
-                    mapping[acc] = str(gene).split(" ")[0]
-    except Exception as e:
-        print(f"Warning: UniProt mapping failed: {e}", file=sys.stderr)
-        return
+        primary = float(header[diff_idx][len("diff_exp_prob_"):])
+        reported = np.array([[float(row[i]) for i in (diff_idx, pep_idx, q_idx)] for row in rows])
+        distributions = np.array([posteriors[row[prot_idx]] for row in rows])
+    except (ValueError, KeyError, IndexError):
+        return False
+    distributions = distributions / distributions.sum(axis=1, keepdims=True)
+
+    def diff_exp_probs(threshold: float, inclusive: bool) -> np.ndarray:
+        above = np.abs(grid) >= threshold if inclusive else np.abs(grid) > threshold
+        return distributions[:, above].sum(axis=1)
+
+    # Pick the conventions under which the primary run's columns are reproduced
+    method = None
+    for inclusive in (False, True):
+        diff = diff_exp_probs(primary, inclusive)
+        if np.max(np.abs(diff - reported[:, 0])) > FOLD_CHANGE_SWEEP_TOLERANCE:
+            continue
+        if np.max(np.abs((1.0 - diff) - reported[:, 1])) > FOLD_CHANGE_SWEEP_TOLERANCE:
+            continue
+        for monotone in (False, True):
+            if np.max(np.abs(posterior_qvalues(1.0 - diff, monotone) - reported[:, 2])) <= FOLD_CHANGE_SWEEP_TOLERANCE:
+                method = (inclusive, monotone)
+                break
+        if method:
+            break
+    if method is None:
+        print("Warning: Could not reproduce Triqler's statistics from its fold change posteriors", file=sys.stderr)
+        return False
+
+    inclusive, monotone = method
+    for threshold in thresholds:
+        diff = diff_exp_probs(threshold, inclusive)
+        peps = 1.0 - diff
+        qvalues = posterior_qvalues(peps, monotone)
+        sweep_header = list(header)
+        sweep_header[diff_idx] = f"diff_exp_prob_{threshold}"
+        sweep_file = fold_change_sweep_file(output_dir, threshold)
+        with open(sweep_file, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f, delimiter="\t")
+            writer.writerow(sweep_header)
+            for i in np.argsort(peps, kind="stable"):
+                row = list(rows[i])
+                row[diff_idx] = f"{diff[i]:.6g}"
+                row[pep_idx] = f"{peps[i]:.6g}"
+                row[q_idx] = f"{qvalues[i]:.6g}"
+                writer.writerow(row)
+        print(f"Fold change threshold {threshold:g} results written to: {sweep_file}")
+    return True
+
+
+def run_triqler_mode(triqler_args: List[str], triqler_mode: str, progress: "TriqlerProgress") -> int:
+    """Runs Triqler in-process in library mode, falling back to a subprocess when that is unavailable."""
+    returncode = None
+    if triqler_mode == "library":
+        print(f"Running Triqler in-process: triqler {' '.join(triqler_args)}")
+        returncode = run_triqler_in_process(triqler_args, progress)
+
+    if returncode is None:
+        cmd = [sys.executable, "-m", "triqler"] + triqler_args
+        print(f"Running Triqler: {' '.join(cmd)}", flush=True)
+        returncode = run_triqler_subprocess(cmd, progress)
+    return returncode
+
+
+def sweep_triqler_args(triqler_args: List[str], out_file: str, threshold: float) -> List[str]:
+    """Returns Triqler arguments for a rerun at another fold change threshold, without extra outputs."""
+    args = []
+    skip_value = False
+    for i, arg in enumerate(triqler_args):
+        if skip_value:
+            skip_value = False
+            continue
+        if arg in ("--write_protein_posteriors", "--write_group_posteriors", "--write_fold_change_posteriors"):
+            skip_value = True
+            continue
+        if arg == "--write_spectrum_quants":
+            continue
+        if i > 0 and triqler_args[i - 1] == "--out_file":
+            arg = out_file
+        elif i > 0 and triqler_args[i - 1] == "--fold_change_eval":
+            arg = str(threshold)
+        args.append(arg)
+    return args
+
+
+class RunManifest:
+    """Records each stage's input fingerprints, parameters and output fingerprints in run_manifest.json.
+
+    Files are fingerprinted by size and modification time rather than hashed, so recording
+    a run costs a stat per file even for multi-GB inputs. With resume, a stage can be
+    skipped when its parameters match and its recorded inputs and outputs are unchanged;
+    a file that was touched or copied since simply reruns its stage. A file renamed into
+    place by a later stage (post-processing of Triqler's protein files) keeps the
+    fingerprint of its temporary file, so it still counts as unchanged if it matches that
+    stage's record. Once any stage runs, every later stage runs too.
+    """
+
+    def __init__(self, output_dir: str, resume: bool):
+        self.manifest_file = os.path.join(output_dir, RUN_MANIFEST_FILE)
+        self.resume = resume
+        self.stages = {}
+        if resume and os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                if manifest.get("version") == RUN_MANIFEST_VERSION:
+                    self.stages = manifest.get("stages", {})
+            except (OSError, ValueError) as e:
+                print(f"Warning: Ignoring unreadable {self.manifest_file}: {e}", file=sys.stderr)
 
-    # Update files with gene names
-    for file_path in protein_files:
+    @staticmethod
+    def fingerprint(path: str) -> Optional[str]:
+        """Returns a file's 'size:mtime_ns' fingerprint, or None if it does not exist."""
         try:
-            temp_file = file_path + ".tmp"
-            with open(file_path, "r", encoding="utf-8") as f_in, \
-                 open(temp_file, "w", encoding="utf-8", newline="") as f_out:
-                
-                reader = csv.DictReader(f_in, delimiter="\t")
-                fieldnames = list(reader.fieldnames) if reader.fieldnames else []
-                
-                if "protein" not in fieldnames:
-                    continue
-                
-                prot_idx = fieldnames.index("protein")
-                new_fieldnames = fieldnames[:prot_idx+1] + ["gene_name"] + fieldnames[prot_idx+1:]
-                
-                writer = csv.DictWriter(f_out, fieldnames=new_fieldnames, delimiter="\t")
-                writer.writeheader()
-                
-                for row in reader:
-                    raw_accs = row["protein"].split(";")
-                    genes = []
-                    for r_acc in raw_accs:
-                        clean = raw_to_clean.get(r_acc, r_acc)
-                        g = mapping.get(clean, "")
-                        if g and g not in genes: # Deduplicate while maintaining some sense of order
-                            genes.append(g)
-                    
-                    row["gene_name"] = ";".join(genes)
-                    writer.writerow(row)
-            
-            os.replace(temp_file, file_path)
-        except Exception as e:
-            print(f"Warning: Could not update {file_path} with gene names: {e}", file=sys.stderr)
-    
-    print("Gene name annotation complete.")
+            st = os.stat(path)
+        except OSError:
+            return None
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    def fingerprints(self, paths: Iterable[str]) -> Dict[str, str]:
+        """Returns {path: fingerprint} for the paths that exist."""
+        found = {}
+        for path in paths:
+            fingerprint = self.fingerprint(path)
+            if fingerprint is not None:
+                found[path] = fingerprint
+        return found
+
+    def outputs(self, stage: str) -> List[str]:
+        return list(self.stages.get(stage, {}).get("outputs", {}))
+
+    def _accepted(self, path: str, recorded: str, stage: str) -> set:
+        accepted = {recorded}
+        for later in RUN_STAGES[RUN_STAGES.index(stage):]:
+            later_fingerprint = self.stages.get(later, {}).get("outputs", {}).get(path)
+            if later_fingerprint:
+                accepted.add(later_fingerprint)
+        return accepted
+
+    def can_skip(self, stage: str, inputs: Iterable[str], params: Dict) -> bool:
+        """Returns whether stage can be skipped on resume."""
+        entry = self.stages.get(stage)
+        if not self.resume or entry is None or not entry.get("completed"):
+            return False
+        if entry.get("params") != json.loads(json.dumps(params)) or set(entry.get("inputs", {})) != set(inputs):
+            return False
+        for path, recorded in list(entry["inputs"].items()) + list(entry.get("outputs", {}).items()):
+            if self.fingerprint(path) not in self._accepted(path, recorded, stage):
+                return False
+        print(f"Resuming: {stage} stage is unchanged, skipping it")
+        return True
+
+    def start(self, stage: str) -> None:
+        """Forgets the records of stage and every later stage before stage runs."""
+        self.resume = False
+        for later in RUN_STAGES[RUN_STAGES.index(stage):]:
+            self.stages.pop(later, None)
+        self.save()
+
+    def complete(
+        self,
+        stage: str,
+        inputs: Dict[str, str],
+        params: Dict,
+        outputs: Dict[str, str],
+        completed: bool = True,
+    ) -> None:
+        """Records a stage from its {path: fingerprint} inputs and outputs."""
+        self.stages[stage] = {
+            "inputs": inputs,
+            "params": json.loads(json.dumps(params)),
+            "outputs": outputs,
+            "completed": completed,
+            "finished": time.time(),
+        }
+        self.save()
+
+    def save(self) -> None:
+        temp_file = f"{self.manifest_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump({"version": RUN_MANIFEST_VERSION, "stages": self.stages}, f, indent=2)
+            os.replace(temp_file, self.manifest_file)
+        except OSError as e:
+            print(f"Warning: Could not write {self.manifest_file}: {e}", file=sys.stderr)
+
+
+def reset_peak_rss() -> bool:
+    """Resets this process's peak RSS (VmHWM) so the next reading covers only what follows; Linux only."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes() -> int:
+    """Returns this process's peak RSS in bytes since start or the last reset_peak_rss()."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def usage_cpu_seconds(usage: resource.struct_rusage) -> float:
+    return usage.ru_utime + usage.ru_stime
+
+
+class RunMetrics:
+    """Collects per-run metrics and writes them to run_metrics.json.
+
+    Each stage records wall time, CPU time of this process and of the child processes it
+    waited for (Triqler subprocess, conversion and post-processing pools), and peak RSS.
+    The process peak is reset at every stage start where Linux allows it ("peak_rss_scope":
+    "stage"); children's peak RSS is the largest child of the run so far, as getrusage
+    cannot reset it. Worker-count decisions and gene lookup timings are recorded alongside.
+    """
+
+    def __init__(self, output_dir: str):
+        self.metrics_file = os.path.join(output_dir, RUN_METRICS_FILE)
+        self.stages: Dict[str, Dict] = {}
+        self.workers: Dict[str, Dict] = {}
+        self.timings: Dict[str, Dict] = {}
+        self.running: Dict[str, tuple] = {}
+        self.lock = threading.RLock()
+        # Replace a previous run's metrics even if every stage is resumed
+        self.save()
+
+    def start(self, stage: str) -> None:
+        scope = "stage" if reset_peak_rss() else "process"
+        self.running[stage] = (
+            time.monotonic(), resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN), scope,
+        )
+
+    def finish(self, stage: str, status: str = "completed") -> None:
+        wall_start, self_start, children_start, scope = self.running.pop(stage)
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        children_maxrss = children_usage.ru_maxrss if sys.platform == "darwin" else children_usage.ru_maxrss * 1024
+        with self.lock:
+            self.stages[stage] = {
+                "status": status,
+                "wall_sec": round(time.monotonic() - wall_start, 3),
+                "cpu_sec": round(usage_cpu_seconds(self_usage) - usage_cpu_seconds(self_start), 3),
+                "children_cpu_sec": round(usage_cpu_seconds(children_usage) - usage_cpu_seconds(children_start), 3),
+                "peak_rss_bytes": peak_rss_bytes(),
+                "peak_rss_scope": scope,
+                "children_peak_rss_bytes": children_maxrss,
+            }
+            self.save()
+
+    def record_workers(self, stage: str, plan: Dict) -> int:
+        """Records a plan_worker_count decision for stage and returns its worker count."""
+        with self.lock:
+            self.workers[stage] = plan
+            self.save()
+        return plan["workers"]
+
+    def timed(self, name: str, func: Callable) -> Callable:
+        """Wraps func so the number and wall time of its calls are recorded under name."""
+        def wrapper(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self.lock:
+                    timing = self.timings.setdefault(name, {"calls": 0, "wall_sec": 0.0})
+                    timing["calls"] += 1
+                    timing["wall_sec"] = round(timing["wall_sec"] + time.monotonic() - started, 3)
+                    self.save()
+        return wrapper
+
+    def save(self) -> None:
+        temp_file = f"{self.metrics_file}.{os.getpid()}.tmp"
+        with self.lock:
+            try:
+                with open(temp_file, "w", encoding="utf-8") as f:
+                    json.dump({"stages": self.stages, "workers": self.workers, "timings": self.timings}, f, indent=2)
+                os.replace(temp_file, self.metrics_file)
+            except OSError as e:
+                print(f"Warning: Could not write {self.metrics_file}: {e}", file=sys.stderr)
+
+
+class TriqlerProgress:
+    """Turns Triqler's 'done / total' progress lines into a JSON file that schedulers can poll.
+
+    The file holds the status, counts, percentage, rate and ETA of the current progress
+    phase. It is replaced atomically at most every PROGRESS_WRITE_INTERVAL seconds.
+    """
+
+    def __init__(self, progress_file: str):
+        self.progress_file = progress_file
+        self.started = time.time()
+        self.done = 0
+        self.total = 0
+        self.phase_start = None
+        self.last_write = 0.0
+        self._lock = threading.Lock()
+        with self._lock:
+            self._write("running", self.started)
+
+    def feed(self, line: str) -> None:
+        match = TRIQLER_PROGRESS_PATTERN.match(line)
+        if not match:
+            return
+        done, total = int(match.group(1)), int(match.group(2))
+        if total <= 0 or done > total:
+            return
+        with self._lock:
+            now = time.time()
+            if self.phase_start is None or total != self.total or done < self.done:
+                # A new progress phase; its rate is measured from here
+                self.phase_start = (now, done)
+            self.done, self.total = done, total
+            if now - self.last_write >= PROGRESS_WRITE_INTERVAL or done == total:
+                self._write("running", now)
+
+    def finish(self, returncode: int) -> None:
+        with self._lock:
+            self._write("finished" if returncode == 0 else "failed", time.time())
+
+    def _write(self, status: str, now: float) -> None:
+        rate = None
+        eta = None
+        if self.phase_start is not None and now > self.phase_start[0] and self.done > self.phase_start[1]:
+            rate = (self.done - self.phase_start[1]) / (now - self.phase_start[0])
+            eta = (self.total - self.done) / rate
+        state = {
+            "status": status,
+            "done": self.done,
+            "total": self.total,
+            "percent": round(100.0 * self.done / self.total, 2) if self.total else None,
+            "proteins_per_sec": round(rate, 3) if rate is not None else None,
+            "eta_sec": round(eta, 1) if eta is not None else None,
+            "elapsed_sec": round(now - self.started, 1),
+            "updated": now,
+        }
+        temp_file = f"{self.progress_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(temp_file, self.progress_file)
+        except OSError as e:
+            print(f"Warning: Could not write {self.progress_file}: {e}", file=sys.stderr)
+        self.last_write = now
+
+
+class ProgressTee:
+    """Text stream forwarding writes to another stream and feeding complete lines to a TriqlerProgress.
+
+    Only writes from the creating process are parsed; worker processes forked by Triqler
+    inherit the stream but should not report progress.
+    """
+
+    def __init__(self, stream: TextIO, progress: TriqlerProgress):
+        self.stream = stream
+        self.progress = progress
+        self.pid = os.getpid()
+        self.pending = ""
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> int:
+        written = self.stream.write(text)
+        if os.getpid() == self.pid:
+            with self._lock:
+                *lines, self.pending = re.split(r"\r\n|\r|\n", self.pending + text)
+                # Never buffer an unbounded line without a terminator
+                self.pending = self.pending[-4096:]
+            for line in lines:
+                self.progress.feed(line)
+        return written
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def run_triqler_in_process(triqler_args: List[str], progress: TriqlerProgress) -> Optional[int]:
+    """Runs Triqler's command line entry point in this process, as `python -m triqler` would.
+
+    This skips interpreter start-up and Triqler's imports in a child process, and Triqler's
+    output goes straight to this process's stdout and stderr, which feed progress meanwhile.
+    Returns the exit status, or None if Triqler cannot be imported here so the caller can
+    fall back to a subprocess.
+    """
+    try:
+        import triqler  # noqa: F401
+    except ImportError as e:
+        print(f"Warning: Cannot run Triqler in-process ({e}), using a subprocess", file=sys.stderr)
+        return None
+
+    saved_argv, saved_stdout, saved_stderr = sys.argv, sys.stdout, sys.stderr
+    sys.argv = ["triqler"] + triqler_args
+    sys.stdout = ProgressTee(saved_stdout, progress)
+    sys.stderr = ProgressTee(saved_stderr, progress)
+    try:
+        runpy.run_module("triqler", run_name="__main__", alter_sys=True)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.argv, sys.stdout, sys.stderr = saved_argv, saved_stdout, saved_stderr
+        sys.stdout.flush()
+    return 0
+
+
+def run_triqler_subprocess(cmd: List[str], progress: TriqlerProgress) -> int:
+    """Runs Triqler as a child process, forwarding its output line by line as it is written."""
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    proc = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, env=env,
+    )
+
+    def forward(source: TextIO, sink: TextIO) -> None:
+        for line in source:
+            sink.write(line)
+            sink.flush()
+            progress.feed(line)
+
+    stderr_thread = threading.Thread(target=forward, args=(proc.stderr, sys.stderr), daemon=True)
+    stderr_thread.start()
+    forward(proc.stdout, sys.stdout)
+    stderr_thread.join()
+    return proc.wait()
 
 
 @click.command()
 @click.option("--input_format", type=click.Choice(["triqler", "diann", "maxquant"]), default="triqler", help="Input file format")
-@click.option("--input_file", required=True, help="Input file path")
+@click.option("--input_file", required=True, help="Input file path (DIA-NN: comma-separated paths or glob patterns for several reports)")
 @click.option("--file_list_file", default=None, help="Sample annotation file (required for DIA-NN/MaxQuant)")
 @click.option("--output_dir", required=True, help="Output directory for results")
+@click.option("--qvalue_threshold", type=float, default=0.01, help="Precursor q-value cutoff applied when reading DIA-NN reports")
+@click.option("--memory_limit_mb", type=int, default=0, help="Stream DIA-NN conversion in batches under this memory ceiling in MB (0 = load the whole report)")
+@click.option("--cache_dir", default=None, envvar="TRIQLER_CACHE_DIR", help="Directory for caching converted DIA-NN/MaxQuant inputs (disabled if unset)")
+@click.option("--cache_max_gb", type=float, default=20.0, help="Size limit of the conversion cache in GB")
+@click.option("--fasta", default=None, help="Search FASTA whose GN= fields annotate gene names offline instead of UniProt")
+@click.option("--gene_annotation", type=click.Choice(["inline", "sidecar"]), default="inline", help="Insert gene names into the protein files or write them to gene_annotations.tsv")
+@click.option("--gene_cache", default=None, envvar="TRIQLER_GENE_CACHE", help="SQLite file caching UniProt gene names across runs (disabled if unset)")
+@click.option("--gene_cache_ttl_days", type=float, default=30.0, help="Age in days after which cached gene names are refetched")
+@click.option("--gene_cache_max_entries", type=int, default=1000000, help="Number of accessions kept in the gene name cache (0 = unlimited)")
+@click.option("--uniprot_url", default=UNIPROT_URL, envvar="TRIQLER_UNIPROT_URL", help="Base URL of the UniProt REST API used for gene names")
+@click.option("--uniprot_batch_size", type=click.IntRange(1, UNIPROT_MAX_BATCH_SIZE), default=250, help="Accessions per UniProt request")
+@click.option("--uniprot_concurrency", type=click.IntRange(min=1), default=4, help="Concurrent UniProt requests")
+@click.option("--uniprot_retries", type=click.IntRange(min=0), default=3, help="Retries per failed UniProt request")
+@click.option("--intermediate_format", type=click.Choice(["tsv", "arrow"]), default="tsv", help="Format of the converted DIA-NN/MaxQuant input read by the stages before Triqler; Triqler itself always reads a TSV")
+@click.option("--write_triqler_input", is_flag=True, default=False, help="Keep triqler_input.tsv when using the arrow intermediate")
+@click.option("--decoy_fraction", type=click.FloatRange(0.0, 1.0), default=1.0, help="Fraction of decoy proteins kept during conversion")
+@click.option("--resume", is_flag=True, default=False, help="Skip stages whose inputs, parameters and outputs are unchanged since the last run in output_dir")
+@click.option("--triqler_mode", type=click.Choice(["library", "subprocess"]), default="subprocess", help="Run Triqler in a separate Python process or, skipping its start-up, in this one; Triqler's worker processes are then forked while this process runs threads")
+@click.option("--fold_change_sweep", default=None, help="Comma-separated log2 fold change thresholds to report as proteins_fc<X>.tsv from the same run")
 @click.option("--fold_change_eval", type=float, default=1.0, help="Log2 fold change threshold")
 @click.option("--decoy_pattern", default="decoy_", help="Decoy protein prefix")
 @click.option("--min_samples", type=int, default=2, help="Minimum peptide quantifications required")
@@ -246,6 +2346,25 @@ def run_triqler(
     input_file: str,
     file_list_file: Optional[str],
     output_dir: str,
+    qvalue_threshold: float,
+    memory_limit_mb: int,
+    cache_dir: Optional[str],
+    cache_max_gb: float,
+    fasta: Optional[str],
+    gene_annotation: str,
+    gene_cache: Optional[str],
+    gene_cache_ttl_days: float,
+    gene_cache_max_entries: int,
+    uniprot_url: str,
+    uniprot_batch_size: int,
+    uniprot_concurrency: int,
+    uniprot_retries: int,
+    intermediate_format: str,
+    write_triqler_input: bool,
+    decoy_fraction: float,
+    resume: bool,
+    triqler_mode: str,
+    fold_change_sweep: Optional[str],
     fold_change_eval: float,
     decoy_pattern: str,
     min_samples: int,
@@ -259,8 +2378,14 @@ def run_triqler(
 ) -> None:
     """Run Triqler protein quantification with error propagation."""
     os.makedirs(output_dir, exist_ok=True)
+    manifest = RunManifest(output_dir, resume)
+    metrics = RunMetrics(output_dir)
+    sweep_thresholds = parse_fold_change_sweep(fold_change_sweep)
 
-    triqler_input_file = input_file
+    # Only DIA-NN accepts several reports; other paths are taken literally
+    input_files = resolve_input_files(input_file) if input_format == "diann" else [input_file]
+    triqler_input_file = input_files[0]
+    conditions = None
 
     if input_format in ("diann", "maxquant"):
         if not file_list_file:
@@ -268,74 +2393,254 @@ def run_triqler(
                 f"--file_list_file is required when using {input_format} format. "
                 "This file maps run names to experimental conditions."
             )
+        if decoy_fraction < 1.0:
+            print(f"Warning: Keeping only {decoy_fraction:g} of the decoy proteins changes the target/decoy "
+                  "ratio that Triqler's FDR estimate relies on; reported q-values are not corrected for it.",
+                  file=sys.stderr)
 
         triqler_input_file = os.path.join(output_dir, "triqler_input.tsv")
+        if intermediate_format == "arrow":
+            triqler_input_file = os.path.join(output_dir, "triqler_input" + ARROW_INPUT_SUFFIX)
+
+        convert_params = {
+            "input_format": input_format,
+            "converter_version": CONVERTER_VERSION,
+            "qvalue_threshold": qvalue_threshold,
+            "decoy_pattern": decoy_pattern,
+            "intermediate": os.path.splitext(triqler_input_file)[1],
+            "decoy_fraction": decoy_fraction,
+        }
+        convert_inputs = input_files + [file_list_file]
+
+        if not manifest.can_skip("convert", convert_inputs, convert_params):
+            manifest.start("convert")
+            metrics.start("convert")
+            cache_key = None
+            if cache_dir:
+                try:
+                    cache_key = conversion_cache_key(
+                        input_files, file_list_file, input_format,
+                        {
+                            "qvalue_threshold": qvalue_threshold,
+                            "decoy_pattern": decoy_pattern,
+                            "intermediate": os.path.splitext(triqler_input_file)[1],
+                            "decoy_fraction": decoy_fraction,
+                        },
+                    )
+                except OSError as e:
+                    print(f"Warning: Conversion cache disabled: {e}", file=sys.stderr)
+
+            if cache_key and fetch_cached_conversion(cache_dir, cache_key, triqler_input_file):
+                print(f"Reusing cached conversion {cache_key} from {cache_dir}")
+            else:
+                # A previous cache hit leaves a hardlink here; never write through it into the cache
+                if os.path.lexists(triqler_input_file):
+                    os.remove(triqler_input_file)
+
+                if input_format == "diann":
+                    conditions = convert_diann_to_triqler(
+                        input_files, file_list_file, triqler_input_file, decoy_pattern, qvalue_threshold,
+                        memory_limit_mb, metrics.record_workers("convert", plan_worker_count(num_threads)),
+                        decoy_fraction,
+                    )
+                elif input_format == "maxquant":
+                    conditions = convert_maxquant_to_triqler(
+                        input_files[0], file_list_file, triqler_input_file, decoy_pattern, decoy_fraction,
+                    )
 
-        if input_format == "diann":
-            convert_diann_to_triqler(input_file, file_list_file, triqler_input_file)
-        elif input_format == "maxquant":
-            convert_maxquant_to_triqler(input_file, file_list_file, triqler_input_file)
+                if cache_key:
+                    try:
+                        store_cached_conversion(cache_dir, cache_key, triqler_input_file, int(cache_max_gb * 1024 ** 3))
+                    except OSError as e:
+                        print(f"Warning: Could not cache converted input: {e}", file=sys.stderr)
+
+            manifest.complete(
+                "convert", manifest.fingerprints(convert_inputs), convert_params, manifest.fingerprints([triqler_input_file]),
+            )
+            metrics.finish("convert")
 
         print(f"Converted input saved to: {triqler_input_file}")
 
+    elif detect_compression(triqler_input_file):
+        # Triqler parses its input by path, so a compressed Triqler-format input is unpacked for it
+        triqler_input_file = os.path.join(output_dir, "triqler_input.tsv")
+        convert_params = {"decompress": True}
+        if not manifest.can_skip("convert", input_files, convert_params):
+            manifest.start("convert")
+            metrics.start("convert")
+            if os.path.lexists(triqler_input_file):
+                os.remove(triqler_input_file)
+            with open_input_stream(input_files[0]) as f_in, open(triqler_input_file, "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out, 16 * 1024 * 1024)
+            manifest.complete(
+                "convert", manifest.fingerprints(input_files), convert_params, manifest.fingerprints([triqler_input_file]),
+            )
+            metrics.finish("convert")
+        print(f"Decompressed input saved to: {triqler_input_file}")
+
     # Export mapping for clarity
-    export_condition_mapping(triqler_input_file, output_dir)
+    mapping_file = os.path.join(output_dir, "condition_mapping.tsv")
+    if not manifest.can_skip("condition_mapping", [triqler_input_file], {}):
+        manifest.start("condition_mapping")
+        metrics.start("condition_mapping")
+        export_condition_mapping(triqler_input_file, output_dir, conditions)
+        manifest.complete(
+            "condition_mapping", manifest.fingerprints([triqler_input_file]), {}, manifest.fingerprints([mapping_file]),
+        )
+        metrics.finish("condition_mapping")
 
-    out_file = os.path.join(output_dir, "proteins.tsv")
+    triqler_params = {
+        "fold_change_eval": fold_change_eval,
+        "decoy_pattern": decoy_pattern,
+        "min_samples": min_samples,
+        "missing_value_prior": missing_value_prior,
+        "use_ttest": use_ttest,
+        "write_spectrum_quants": write_spectrum_quants,
+        "write_protein_posteriors": write_protein_posteriors,
+        "write_group_posteriors": write_group_posteriors,
+        "write_fold_change_posteriors": write_fold_change_posteriors,
+        "fold_change_sweep": sweep_thresholds,
+    }
+    postprocess_params = {
+        "decoy_pattern": decoy_pattern,
+        "gene_annotation": gene_annotation,
+        "gene_source": os.path.abspath(fasta) if fasta else uniprot_url,
+    }
+    skip_triqler = manifest.can_skip("triqler", [triqler_input_file], triqler_params)
+    skip_postprocess = skip_triqler and manifest.can_skip(
+        "postprocess", manifest.outputs("triqler") + ([fasta] if fasta else []), postprocess_params,
+    )
 
-    cmd = [
-        sys.executable, "-m", "triqler",
-        "--out_file", out_file,
-        "--fold_change_eval", str(fold_change_eval),
-        "--decoy_pattern", decoy_pattern,
-        "--min_samples", str(min_samples),
-    ]
+    # Gene names depend only on the input's accessions, so they are resolved while Triqler runs
+    gene_lookup = partial(
+        fetch_gene_names, base_url=uniprot_url, batch_size=uniprot_batch_size,
+        concurrency=uniprot_concurrency, retries=uniprot_retries,
+    )
+    if fasta:
+        gene_lookup = partial(fasta_gene_names, fasta_file=fasta, fallback_dir=output_dir)
+    elif gene_cache:
+        gene_lookup = partial(
+            cached_gene_names, cache_file=gene_cache, ttl_days=gene_cache_ttl_days,
+            max_entries=gene_cache_max_entries, fetcher=gene_lookup,
+        )
+    gene_lookup = metrics.timed("gene_lookup", gene_lookup)
+    if not skip_postprocess:
+        metrics.start("gene_prefetch")
+        gene_prefetch = start_gene_prefetch(triqler_input_file, decoy_pattern, gene_lookup)
+        metrics.finish("gene_prefetch")
 
-    if missing_value_prior == "DIA":
-        cmd.extend(["--missing_value_prior", "DIA"])
+    if not skip_triqler:
+        manifest.start("triqler")
+        metrics.start("triqler")
 
-    if num_threads > 0:
-        cmd.extend(["--num_threads", str(num_threads)])
+        # Triqler only parses text input, so the arrow intermediate is materialized for it
+        triqler_tsv_file = triqler_input_file
+        if triqler_input_file.endswith(ARROW_INPUT_SUFFIX):
+            triqler_tsv_file = os.path.join(output_dir, "triqler_input.tsv")
+            if os.path.lexists(triqler_tsv_file):
+                os.remove(triqler_tsv_file)
+            arrow_to_triqler_tsv(triqler_input_file, triqler_tsv_file)
+
+        out_file = os.path.join(output_dir, "proteins.tsv")
+
+        triqler_args = [
+            "--out_file", out_file,
+            "--fold_change_eval", str(fold_change_eval),
+            "--decoy_pattern", decoy_pattern,
+            "--min_samples", str(min_samples),
+        ]
+
+        if missing_value_prior == "DIA":
+            triqler_args.extend(["--missing_value_prior", "DIA"])
 
-    # Input file must come before boolean flags in some versions of Triqler
-    cmd.append(triqler_input_file)
+        # Triqler's own default uses every host core, ignoring cgroup quotas and memory limits
+        worker_plan = plan_worker_count(num_threads, os.path.getsize(triqler_tsv_file))
+        workers = metrics.record_workers("triqler", worker_plan)
+        print(f"Using {workers} Triqler workers (limited by {worker_plan['limited_by']})")
+        triqler_args.extend(["--num_threads", str(workers)])
 
-    if use_ttest:
-        cmd.append("--ttest")
+        # Input file must come before boolean flags in some versions of Triqler
+        triqler_args.append(triqler_tsv_file)
 
-    if write_spectrum_quants:
-        cmd.append("--write_spectrum_quants")
+        if use_ttest:
+            triqler_args.append("--ttest")
 
-    if write_protein_posteriors:
-        posteriors_path = os.path.join(output_dir, "protein_posteriors.tsv")
-        cmd.extend(["--write_protein_posteriors", posteriors_path])
+        if write_spectrum_quants:
+            triqler_args.append("--write_spectrum_quants")
 
-    if write_group_posteriors:
-        group_path = os.path.join(output_dir, "group_posteriors.tsv")
-        cmd.extend(["--write_group_posteriors", group_path])
+        posterior_files = []
+        if write_protein_posteriors:
+            posteriors_path = os.path.join(output_dir, "protein_posteriors.tsv")
+            triqler_args.extend(["--write_protein_posteriors", posteriors_path])
+            posterior_files.append(posteriors_path)
 
-    if write_fold_change_posteriors:
+        if write_group_posteriors:
+            group_path = os.path.join(output_dir, "group_posteriors.tsv")
+            triqler_args.extend(["--write_group_posteriors", group_path])
+            posterior_files.append(group_path)
+
+        # A sweep is derived from the fold change posteriors, so they are written for it too
         fc_path = os.path.join(output_dir, "fold_change_posteriors.tsv")
-        cmd.extend(["--write_fold_change_posteriors", fc_path])
+        if write_fold_change_posteriors or sweep_thresholds:
+            triqler_args.extend(["--write_fold_change_posteriors", fc_path])
+        if write_fold_change_posteriors:
+            posterior_files.append(fc_path)
 
-    print(f"Running Triqler: {' '.join(cmd)}")
+        # Results of an earlier sweep would otherwise be picked up as this run's outputs
+        for stale_file in glob.glob(os.path.join(output_dir, "proteins_fc*.tsv")):
+            os.remove(stale_file)
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
+        progress = TriqlerProgress(os.path.join(output_dir, PROGRESS_FILE))
+        returncode = run_triqler_mode(triqler_args, triqler_mode, progress)
 
-    if result.stdout:
-        print(result.stdout)
+        if returncode == 0 and sweep_thresholds:
+            if not write_fold_change_sweep(out_file, fc_path, sweep_thresholds, output_dir):
+                # Fall back to one Triqler run per threshold, still sharing conversion and mapping
+                for threshold in sweep_thresholds:
+                    sweep_file = fold_change_sweep_file(output_dir, threshold)
+                    if threshold == fold_change_eval:
+                        # The primary run already evaluated this threshold
+                        copy_protein_results(out_file, sweep_file)
+                        continue
+                    sweep_args = sweep_triqler_args(triqler_args, sweep_file, threshold)
+                    returncode = run_triqler_mode(sweep_args, triqler_mode, progress)
+                    if returncode != 0:
+                        break
+            if not write_fold_change_posteriors and os.path.exists(fc_path):
+                os.remove(fc_path)
 
-    if result.stderr:
-        print(result.stderr, file=sys.stderr)
+        progress.finish(returncode)
+        if returncode != 0:
+            metrics.finish("triqler", "failed")
+            sys.exit(returncode)
 
-    if result.returncode != 0:
-        sys.exit(result.returncode)
+        if triqler_tsv_file != triqler_input_file and not write_triqler_input:
+            os.remove(triqler_tsv_file)
+
+        triqler_outputs = sorted(glob.glob(os.path.join(output_dir, "proteins*.tsv"))) + posterior_files
+        manifest.complete(
+            "triqler", manifest.fingerprints([triqler_input_file]), triqler_params, manifest.fingerprints(triqler_outputs),
+        )
+        metrics.finish("triqler")
+
+    if not skip_postprocess:
+        manifest.start("postprocess")
+        metrics.start("postprocess")
+        postprocess_inputs = manifest.fingerprints(manifest.outputs("triqler") + ([fasta] if fasta else []))
 
-    # Cleanup malformed columns (extra peptides) before processing
-    cleanup_protein_files(output_dir)
+        def record_postprocess(rewritten: Dict[str, str], succeeded: bool) -> None:
+            outputs = {file_path: manifest.fingerprint(temp_file) for file_path, temp_file in rewritten.items()}
+            if gene_annotation == "sidecar":
+                outputs.update(manifest.fingerprints([os.path.join(output_dir, GENE_ANNOTATIONS_FILE)]))
+            manifest.complete("postprocess", postprocess_inputs, postprocess_params, outputs, succeeded)
 
-    # Add gene names using UniProt
-    add_gene_names(output_dir, decoy_pattern)
+        # Cleanup malformed columns (extra peptides) and add gene names from the prefetched lookup
+        postprocess_protein_files(
+            output_dir, decoy_pattern, metrics.record_workers("postprocess", plan_worker_count(num_threads)),
+            partial(prefetched_gene_names, prefetch=gene_prefetch, gene_lookup=gene_lookup), gene_annotation,
+            record_postprocess,
+        )
+        metrics.finish("postprocess")
 
     print(f"Triqler analysis complete. Results written to: {output_dir}")
 